@@ -1,36 +1,64 @@
 import asyncio
-from collections import deque
 import json
 import logging
 import os
+import time
 from typing import Callable
 
+startup_started = time.perf_counter() # Cold start is measured from here, before the heavy imports
+
 import aiohttp
 from aiohttp.resolver import AsyncResolver
-from cryptography.fernet import Fernet
 import discord
 from discord.ext import commands, tasks
 
 from utils.AiohttpManager import AiohttpManager, APIRequestError
+from utils.KeywordMatcher import KeywordMatcher, _PATTERN_WORD
+from utils.LatencyTracker import LatencyTracker
+from utils.LoopMonitor import LoopMonitor
+from utils.StartupTimer import StartupTimer
+from utils.TokenHealth import TokenHealth
+import utils.clientprofiles as clientprofiles
 import utils.config as config
 import utils.datasets as datasets
+import utils.filtering as filtering
 import utils.helpers as helpers
 import utils.keepalive as keepalive
+import utils.keyrotation as keyrotation
+import utils.polling as polling
+import utils.rendering as rendering
+import utils.scheduling as scheduling
+import utils.transports as transports
 
 
 """<-- VARIABLES -->"""
 
+startup_timer = StartupTimer(startup_started)
+startup_timer.phase("imports")
+
 # Environment variables
 bot_token = os.environ["DISCORD_BOT_TOKEN"] # Discord bot token
 dataset_id = os.environ["DATASET_ID"] # ID of the HF dataset
 hf_api_key = os.environ["HF_API_KEY"] # HF API key to access the dataset
-fernet = Fernet(os.environ["FERNET_KEY"].encode()) # Fernet key
+fernet_keys = os.environ["FERNET_KEY"].split(",") # Comma separated Fernet keys, newest first (older keys only decrypt, until rotated)
+fernet = keyrotation.make_fernet(fernet_keys)
 nameservers = os.getenv("NAMESERVERS") # Comma separated nameservers to use for gateway connection, if applicable
+shard_count = os.getenv("SHARD_COUNT") # Set to run an AutoShardedBot, either "auto" or a number of shards
+memory_profile = os.getenv("MEMORY_PROFILE", "default") # discord.py cache profile, see config.client_profiles
+http_transport = os.getenv("HTTP_TRANSPORT") # Set to record:path or replay:path[:speed] to record/replay Flat API responses
+loop_monitor_enabled = bool(os.getenv("LOOP_MONITOR")) # Set to sample event loop lag and attribute blocking calls
 
 # Other variables
-aiohttp_manager = AiohttpManager()
-user_data_changed = False # Global
-user_data = datasets.load_dataset(dataset_id, config.datafile_name, hf_api_key) # Global
+aiohttp_manager = AiohttpManager(transports.from_spec(http_transport))
+loop_monitor = LoopMonitor()
+latency_tracker = LatencyTracker()
+dirty_user_ids = set() # Ids of users changed (or removed) since the dataset was last updated
+persisted_records = {} # user id: (version, JSON) of users as last serialized, see datasets.serialize_users
+persist_lock = asyncio.Lock() # Only one dataset update at a time
+key_rotation_running = False # Global
+last_loop_tick = None # Global, time.monotonic() of the latest check_notifs_loop heartbeat
+user_data = [] # Global, loaded in main() concurrently with the gateway login and handshake
+user_data_loaded = asyncio.Event() # Set once user_data is loaded; handlers that need it wait for it
 
 # Set logging level
 helpers.log("LOGGING_LEVEL:", l := os.environ["LOGGING_LEVEL"])
@@ -43,26 +71,79 @@ elif l == "DEBUG":
 """<-- MISC FUNCTIONS -->"""
 
 def change_interval_calc() -> int:
-    """Length of user_data times x, unless len(user_data) is 0 then default to y."""
-    return (
-        len(user_data) * config.delay_amounts["per_user"] 
-        if len(user_data) > 0 else config.delay_amounts["per_loop_default"]
-    )
+    """Number of users to poll times x, unless there are none then default to y."""
+    return scheduling.loop_interval(user_data)
+
+def is_ready() -> bool:
+    """Whether check_notifs_loop has ticked recently enough to be considered alive."""
+    if last_loop_tick is None:
+        return False
+    return (time.monotonic() - last_loop_tick) <= config.ready_tick_tolerance * change_interval_calc()
+
+def prepare_user(user: dict) -> None:
+    """Set up a loaded or newly registered user's runtime properties."""
+    user["important"].setdefault("keyword", []) # Added after some users registered
+    user.setdefault("processed_ids", None) # Set once the user's notifications are first read
+    user["health"] = TokenHealth()
+    user["lock"] = asyncio.Lock() # Held while a command or check_notifs_loop changes the user's state across awaits
+    user["version"] = datasets.new_version() # Renewed on every persisted change
+    user["removed"] = False # Set on unregister, so an in-progress poll stops sending
+    build_matcher(user)
+
+def build_matcher(user: dict) -> None:
+    """(Re)build the user's keyword matcher; call whenever their keyword rules change."""
+    user["matcher"] = KeywordMatcher(user["important"]["keyword"])
+
+def mark_changed(user: dict) -> None:
+    """Renew the user's version and flag them for the next dataset update."""
+    user["version"] = datasets.new_version()
+    dirty_user_ids.add(user["id"])
+
+def set_rules(user: dict, important: dict) -> None:
+    """Swap in the user's new rules (copy-on-write; the old rules are never changed in place)."""
+    user["important"] = important
+    build_matcher(user)
+    mark_changed(user)
+
+async def record_poll_failure(user: dict) -> None:
+    """Back off polling the user, notifying them if their token was just quarantined."""
+    if user["health"].record_failure():
+        helpers.log(f"Quarantined token of user id {user['id']} ({user.get('object')}) after {user['health'].failures} failures")
+        try:
+            await user["object"].send(config.quarantine_msg)
+        except Exception as e:
+            helpers.log(f"Error sending quarantine message to user id {user['id']} ({user.get('object')}):", e)
 
-def filter_user_data(exclude: set[str]) -> list[dict]:
-    """Don't write any of the excluded properties."""
-    return [
-        {
-            key: value for key, value in user.items() 
-            if (key not in exclude)
-        }
-        for user in user_data
-    ]
+async def record_poll_success(user: dict) -> None:
+    """Reset the user's backoff, notifying them if their token was restored from quarantine."""
+    if user["health"].record_success():
+        helpers.log(f"Restored token of user id {user['id']} ({user['object']}) from quarantine")
+        try:
+            await user["object"].send(config.restored_msg)
+        except Exception as e:
+            helpers.log(f"Error sending restored message to user id {user['id']} ({user['object']}):", e)
+
+async def persist_user_data() -> None:
+    """Update the dataset in a thread so the event loop isn't blocked, only re-serializing changed users."""
+    await user_data_loaded.wait() # Never overwrite the dataset before it has been loaded
+    async with persist_lock:
+        persisting = set(dirty_user_ids)
+        dirty_user_ids.clear() # Cleared first so changes made during the upload are persisted next time
+        # Serialized on the loop, so the writer thread never sees users mid-change
+        serialized = datasets.serialize_users(user_data, persisted_records)
+        try:
+            await asyncio.to_thread(datasets.update_dataset, serialized, dataset_id, config.datafile_name, hf_api_key)
+        except Exception:
+            dirty_user_ids.update(persisting)
+            raise
 
 async def convert_identifier(identifier: str, convert_to: str, api_key: str) -> str:
     """Convert id to username and vice versa."""
     try:
-        data = await aiohttp_manager.read_api(config.user_api_url.format(identifier=identifier), api_key)
+        data = await aiohttp_manager.read_api(
+            config.user_api_url.format(identifier=identifier), api_key,
+            cache_ttl=config.api_cache_ttls["user_lookup"], per_key=False # Public profiles look the same to every token
+        )
         await asyncio.sleep(config.delay_amounts["per_convert"])
         if not data:
             helpers.log(f"User not found with identifier: {identifier}")
@@ -76,6 +157,14 @@ async def convert_identifier(identifier: str, convert_to: str, api_key: str) ->
         helpers.log("Edge case http code handler during identifier convert:", e)
         raise
 
+async def lookup_user(bot: commands.Bot, user_id: int) -> discord.User:
+    """Get a Discord user from the cache, falling back to a REST lookup if it isn't cached."""
+    return bot.get_user(int(user_id)) or await bot.fetch_user(int(user_id))
+
+async def lookup_channel(bot: commands.Bot, channel_id: int) -> discord.abc.Messageable:
+    """Get a Discord channel from the cache, falling back to a REST lookup if it isn't cached."""
+    return bot.get_channel(int(channel_id)) or await bot.fetch_channel(int(channel_id))
+
 def get_user(ctx: commands.Context | discord.Message) -> dict | None:
     """Get the user from user_data."""
     for user in user_data:
@@ -85,6 +174,7 @@ def get_user(ctx: commands.Context | discord.Message) -> dict | None:
 def is_registered() -> Callable[[commands.Context], bool]:
     """Registration check decorator."""
     async def func(ctx: commands.Context) -> bool:
+        await user_data_loaded.wait()
         user = get_user(ctx)
         if not user:
             await ctx.send(config.welcome_msg)
@@ -93,7 +183,6 @@ def is_registered() -> Callable[[commands.Context], bool]:
 
 async def register_user(api_key: str, message: discord.Message) -> None:
     """Register the user."""
-    global user_data_changed
     try: # Read API to see if API key was valid
         elements = await aiohttp_manager.read_api(config.notif_api_url, api_key)
     except APIRequestError as e: # handle edge case http codes
@@ -112,7 +201,8 @@ async def register_user(api_key: str, message: discord.Message) -> None:
             "important": {
                 "actor.username": {},
                 "type": [],
-                "attachments.score.id": []
+                "attachments.score.id": [],
+                "keyword": []
             },
             "override": False,
             "paused": False,
@@ -120,14 +210,15 @@ async def register_user(api_key: str, message: discord.Message) -> None:
                 "bool": False
             },
             "object": message.author,
-            "processed_ids": deque(reversed([element['id'] for element in elements]), maxlen=config.notif_cache_length)
+            "processed_ids": polling.new_processed_ids(elements)
         }
+        prepare_user(user)
         user_data.append(user)
         await message.channel.send(
             "Successfully registered! (If you didn't mean to do this, use the command  `%flatnotifs unregister`. "
             "To learn how to start setting rules, use the command  `%flatnotifs help` )"
         )
-        user_data_changed = True
+        mark_changed(user)
     else:
         await message.channel.send(
             "Please try again and provide a valid personal token "
@@ -140,17 +231,25 @@ async def register_user(api_key: str, message: discord.Message) -> None:
 async def main():
     """<-- INSTANTIATE DISCORD BOT -->"""
 
-    intents = discord.Intents.default()
-    intents.message_content = True
+    profile = config.client_profiles[memory_profile]
+    helpers.log("MEMORY_PROFILE:", memory_profile)
     resolver = AsyncResolver(nameservers=nameservers.split(",") if nameservers else nameservers)
     connector = aiohttp.TCPConnector(resolver=resolver)
-    bot = commands.Bot(
+    if shard_count: # One process, one websocket per shard
+        helpers.log("SHARD_COUNT:", shard_count)
+        bot_class = commands.AutoShardedBot
+        shard_kwargs = {} if shard_count == "auto" else {"shard_count": int(shard_count)}
+    else:
+        bot_class = commands.Bot
+        shard_kwargs = {}
+    bot = bot_class(
         command_prefix="%flatnotifs ",
         case_insensitive=True,
         strip_after_prefix=True,
         help_command=None,
-        intents=intents,
         connector=connector,
+        **clientprofiles.client_options(profile),
+        **shard_kwargs,
     )
 
 
@@ -160,133 +259,67 @@ async def main():
     async def check_notifs_loop() -> None:
         """Check notifications every change_interval_calc seconds."""    
         check_notifs_loop.change_interval(seconds=change_interval_calc())
-        global user_data_changed
-        if user_data_changed: # Update dataset
+        global last_loop_tick
+        last_loop_tick = time.monotonic()
+        startup_timer.mark_ready()
+        if dirty_user_ids: # Update dataset
             try:
-                filtered_user_data = filter_user_data(exclude={"object", "processed_ids", "channel"})
-                datasets.update_dataset(filtered_user_data, dataset_id, config.datafile_name, hf_api_key)
-                user_data_changed = False
+                await persist_user_data()
             except Exception as e:
                 helpers.log("Error, failed to update dataset (will retry next loop):", e)
 
         for user in list(user_data):
-            if not user["paused"]:
-                # Get the newest element and element list
-                api_key = fernet.decrypt(user["api_key"].encode()).decode()
-                excluded = False
-                try:
-                    elements = await aiohttp_manager.read_api(config.notif_api_url, api_key)
-                except APIRequestError as e: # handle edge case http codes
-                    helpers.log("Edge case http code handler:", e)
+            deliveries = [] # (element, triggered_rules, trace) to send once the user's lock is released
+            async with user["lock"]: # Commands can't change the user's state mid-poll
+                if user["removed"] or user["paused"] or not user["health"].due(): # Skip users that are backing off or quarantined
                     continue
 
                 if not user["object"]: # Try to fetch user object if it hasn't been set yet
                     try: 
-                        user["object"] = await bot.fetch_user(user["id"])
+                        user["object"] = await lookup_user(bot, user["id"])
                     except Exception as e:
                         user["paused"] = True
+                        mark_changed(user)
                         helpers.log(f"Error, user id {user['id']} ({user['object']}) not found:", e)
                         continue
 
-                if not user["processed_ids"] or not elements: # Check if user processed ids set and that there are elements
-                    user["paused"] = True
-                    user_data_changed = True
-                    await user["object"].send(config.check_err_msg)
+                api_key = fernet.decrypt(user["api_key"].encode()).decode()
+                deliveries = await polling.poll_user(user, api_key, aiohttp_manager, latency_tracker, set_rules)
+                if deliveries is None: # Invalid token or server error, back off instead of pausing
+                    helpers.log(f"Unable to check notifications for user id {user['id']} ({user['object']}), backing off")
+                    await record_poll_failure(user)
                     continue
+                await record_poll_success(user)
 
-                for element in elements:
-                    # Break if element already processed (everything after is also already processed)
-                    if element['id'] in user["processed_ids"]:
-                        break
+            # Output once all rules have been iterated through
+            for element, triggered_rules, trace in deliveries:
+                if user["removed"]: # Unregistered while sending
+                    break
+                # Suppress KeyError
+                try:
+                    m = rendering.render_notification(element, triggered_rules) # Compose message
 
-                    # Iterate through important rules, append to triggered_rules
-                    is_important = False 
-                    triggered_rules = []
-                    for category, values in user["important"].items():
-                        nested_category = ("actor.id" if category == "actor.username" else category).split('.') # split by dots
-                        
-                        # Iterate until you reach the bottom nested category; if not found, continue to next rule
-                        value = element
-                        for k in nested_category:
-                            value = value.get(k, None)
-                            if value is None:
-                                break
-                        if value is None:
-                            continue
-                    
-                        # Check if excluded
-                        if ("-"+value) in values:
-                            excluded = True
-                            if category == "actor.username": # If actor.username
-                                if values["-"+value] != element['actor']['username']: # Update username if changed
-                                    helpers.log("Updated", values["-"+value], "to", element['actor']['username']) # DEBUG
-                                    values["-"+value] = element['actor']['username']
-                                    user_data_changed = True
-                                val = values["-"+value]
-                            else:
-                                val = value
-                            triggered_rules.append(category + ": -" + val)
-                            if not user["override"]:
-                                break
-
-                        # Check if included
-                        if ("+"+value) in values:
-                            if not excluded:
-                                is_important = True
-                            if category == "actor.username": # If actor.username
-                                if values["+"+value] != element['actor']['username']: # Update username if changed
-                                    helpers.log("Updated", values["+"+value], "to", element['actor']['username']) # DEBUG
-                                    values["+"+value] = element['actor']['username']
-                                    user_data_changed = True
-                                val = values["+"+value]
-                            else:
-                                val = value
-                            triggered_rules.append(category + ": +" + val)
-                        
-                    helpers.log(
-                        f"{element['actor']['printableName']}: {element['type']}, ID-{element['id']} "
-                        f"{'is' if is_important else 'is not'} categorized as important"
-                        f"{' by rule(s): ' + str(triggered_rules) if is_important else '.'}"
-                    ) # DEBUG
-
-                    # Output once all rules have been iterated through
-                    if is_important or user["override"]:
-                        # Suppress KeyError
+                    # Send to user's specified channel if configured else send to user
+                    latency_tracker.mark(trace, "sent")
+                    if user["sendhere"]["bool"]:
                         try:
-                            # Set url if applicable
-                            if element['type'] == "scoreComment":
-                                url = element['attachments']['score']['htmlUrl'] + "#c-" + element['attachments']['scoreComment'] + "\n"
-                            elif element['type'] in {"scorePublication", "scoreStar", "scoreInvitation"}:
-                                url = element['attachments']['score']['htmlUrl'] + "\n"               
-                            elif element['type'] == "userFollow":
-                                url = element['actor']['htmlUrl'] + "\n"
-                            else:
-                                url = ""
-                        
-                            # Compose message
-                            m = (
-                                f"{helpers.esc_md(element['actor']['printableName'])}: {helpers.esc_md(element['type'])} [(Open on Flat)]({url})\n"
-                                f"-# Rule(s): {helpers.esc_md(str(triggered_rules))}"
-                            )
-
-                            # Send to user's specified channel if configured else send to user
-                            if user["sendhere"]["bool"]:
-                                try:
-                                    await user["channel"].send(f"{user['object'].mention + ' ' if user['sendhere']['mention'] else ''}{m}")
-                                except Exception as e:
-                                    helpers.log(f"Unable to find specified channel for user id {user['id']} ({user['object']}):", e)
-                                    user["sendhere"]["bool"] = False
-                                    await user["object"].send(config.channel_err_msg)
-                                    await user["object"].send(m)
-                            else:
-                                await user["object"].send(m)
-                        except KeyError as e:
-                            helpers.log(f"Suppressed KeyError during notif url building or notif sending, some expected value was undefined for", element)
-
-                    # Add id to the list of processed ids
-                    user["processed_ids"].append(element['id'])
-                    
-                await asyncio.sleep(config.delay_amounts["per_user"]) # wait between checks
+                            await user["channel"].send(f"{user['object'].mention + ' ' if user['sendhere']['mention'] else ''}{m}")
+                        except Exception as e:
+                            helpers.log(f"Unable to find specified channel for user id {user['id']} ({user['object']}):", e)
+                            async with user["lock"]:
+                                user["sendhere"]["bool"] = False
+                                mark_changed(user)
+                            await user["object"].send(config.channel_err_msg)
+                            await user["object"].send(m)
+                    else:
+                        await user["object"].send(m)
+                    latency_tracker.mark(trace, "acked")
+                except KeyError as e:
+                    helpers.log(f"Suppressed KeyError during notif url building or notif sending, some expected value was undefined for", element)
+                latency_tracker.record(trace)
+
+            last_loop_tick = time.monotonic()
+            await asyncio.sleep(config.delay_amounts["per_user"]) # wait between checks
 
 
     """<-- EVENT HANDLERS -->"""
@@ -295,6 +328,11 @@ async def main():
     async def on_ready() -> None:
         """Prepare on Discord bot startup."""
         helpers.log("Bot has connected to Discord! :3")
+        if startup_timer.ready is None:
+            startup_timer.phase("gateway")
+        await user_data_loaded.wait() # The gateway usually connects first
+        if startup_timer.ready is None:
+            startup_timer.phase("dataset_wait")
 
         # Start the aiohttp session
         helpers.log("Starting aiohttp session...")
@@ -306,13 +344,15 @@ async def main():
         helpers.log("Processing users...")
         for user in user_data:
             try: # Set users and check the user channel can be reached if specified
-                user["object"] = await bot.fetch_user(user["id"])
+                user["object"] = await lookup_user(bot, user["id"])
                 try:
                     if user["sendhere"]["bool"]:
-                        user["channel"] = await bot.fetch_channel(user["sendhere"]["channel_id"])
+                        user["channel"] = await lookup_channel(bot, user["sendhere"]["channel_id"])
                 except Exception as e:
                     helpers.log(f"Unable to find specified channel for user id {user['id']} ({user['object']}):", e)
-                    user["sendhere"]["bool"] = False
+                    async with user["lock"]:
+                        user["sendhere"]["bool"] = False
+                        mark_changed(user)
                     await user["object"].send(config.channel_err_msg)
             except Exception as e:
                 raise Exception(f"Error getting user id {user['id']} ({user['object']}) or user not found:", e)
@@ -320,17 +360,18 @@ async def main():
             try: # Set processed ids per user
                 api_key = fernet.decrypt(user["api_key"].encode()).decode()
                 elements = await aiohttp_manager.read_api(config.notif_api_url, api_key)
-                user["processed_ids"] = deque(reversed([element['id'] for element in elements]), maxlen=config.notif_cache_length)
-            except Exception as e:
-                try:
-                    helpers.log(f"Unable to check notifications for user id {user['id']} ({user['object']}):", e)
-                    user["paused"] = True
-                    await user["object"].send(config.check_err_msg)
-                except Exception as e2:
-                    raise Exception(f"Error sending 'unable to check notifications' message to user id {user['id']} ({user['object']}):", e2)
+                if not elements:
+                    raise ValueError("No elements returned")
+                user["processed_ids"] = polling.new_processed_ids(elements)
+            except Exception as e: # check_notifs_loop will retry with backoff
+                helpers.log(f"Unable to check notifications for user id {user['id']} ({user['object']}):", e)
+                await record_poll_failure(user)
                 
             await asyncio.sleep(config.delay_amounts["per_user_startup"]) # wait between checks
 
+        if startup_timer.ready is None:
+            startup_timer.phase("users")
+
         # Set bot status
         num_users = len(user_data)
         helpers.log(f"{num_users} user(s) on startup")
@@ -349,13 +390,17 @@ async def main():
     @bot.event
     async def on_message(message: discord.Message) -> None:
         """Handle registration, then pass to command handlers."""
+        # Cheap pre-filter so that messages from every guild aren't tokenized
+        if message.author.id == bot.user.id or not message.content.lstrip().startswith("%flatnotifs"):
+            return
         message_content = message.content.split()
 
-        # If no message_content (for example, an image or embed), isn't prefixed with %flatnotifs, or is bot user, return
-        if not message_content or message_content[0] != "%flatnotifs" or message.author.id == bot.user.id:
+        # If no message_content (for example, an image or embed) or isn't prefixed with %flatnotifs, return
+        if not message_content or message_content[0] != "%flatnotifs":
             return
 
         # Get user; if not registered, prompt the user to register
+        await user_data_loaded.wait()
         user = get_user(message)
         if not user:
             if len(message_content) < 3 or not (message_content[1] == "getstarted"):
@@ -411,7 +456,6 @@ async def main():
             )
             return
         
-        global user_data_changed
         user = get_user(ctx)
         api_key = fernet.decrypt(user["api_key"].encode()).decode()
 
@@ -435,6 +479,13 @@ async def main():
             else:
                 input_value_id = input_value
 
+            if category == "keyword" and not _PATTERN_WORD.findall(input_value_id.lower()): # KeywordMatcher would skip it
+                await ctx.send(
+                    f"Keyword {helpers.esc_md(input_value)} has no letters or numbers to match. "
+                    "Please try again with a keyword that contains words (`*` and `?` wildcards are allowed)."
+                )
+                return
+
             if include_exclude == "include":
                 temp = "+"+input_value_id
             elif include_exclude == "exclude":
@@ -447,13 +498,15 @@ async def main():
                 return
             
             if category in user["important"]:
-                if category == "actor.username": # If actor.username, is a dict instead of a list
-                    user["important"][category][temp] = input_value # user_id: user_name
-                else:
-                    user["important"][category].append(temp)
+                async with user["lock"]:
+                    important = filtering.copy_rules(user["important"])
+                    if category == "actor.username": # If actor.username, is a dict instead of a list
+                        important[category][temp] = input_value # user_id: user_name
+                    else:
+                        important[category].append(temp)
+                    set_rules(user, important)
 
                 await ctx.send(f"Rule {helpers.esc_md(category)}: {helpers.esc_md(input_value)} added")
-                user_data_changed = True
             else:
                 await ctx.send(f"Category {helpers.esc_md(category)} not found")
 
@@ -464,7 +517,6 @@ async def main():
             await ctx.send("Please try again and provide a value in this format:  `%flatnotifs removerule value`")
             return
         
-        global user_data_changed
         user = get_user(ctx)
         api_key = fernet.decrypt(user["api_key"].encode()).decode()
         
@@ -491,14 +543,16 @@ async def main():
 
                 for v in [("+"+input_value_id), ("-"+input_value_id)]: # +value and -value
                     if v in values:
-                        if category == "actor.username": # If actor.username, is a dict instead of a list
-                            values.pop(v)
-                        else:
-                            values.remove(v)
+                        async with user["lock"]:
+                            important = filtering.copy_rules(user["important"])
+                            if category == "actor.username": # If actor.username, is a dict instead of a list
+                                important[category].pop(v, None)
+                            elif v in important[category]:
+                                important[category].remove(v)
+                            set_rules(user, important)
 
                         found = True
                         await ctx.send(f"Rule {helpers.esc_md(input_value)} removed from {helpers.esc_md(category)}")
-                        user_data_changed = True
                         break
                     
             if not found:
@@ -507,9 +561,11 @@ async def main():
     @bot.command(description="Activate/deactivate overriding of all rules.")
     @is_registered()
     async def override(ctx: commands.Context) -> None:
-        global user_data_changed
         user = get_user(ctx)
-        if user["override"]:
+        async with user["lock"]:
+            user["override"] = not user["override"]
+            mark_changed(user)
+        if not user["override"]:
             await ctx.send(
                 "Override disabled (You will now only be notified of notifications that "
                 "match your specified filters. Re-enable by using  `%flatnotifs override`)"
@@ -519,48 +575,48 @@ async def main():
                 "Override enabled (You will now be notified of all notifications. "
                 "Disable by using  `%flatnotifs override`)"
             )
-        user["override"] = not user["override"]
-        user_data_changed = True
 
     @bot.command(description="Pause/unpause notifications.")
     @is_registered()
     async def pause(ctx: commands.Context) -> None:
-        global user_data_changed
         user = get_user(ctx)
-        if not user["paused"]:
-            await ctx.send("Notifications paused (You will not be notified of any notifications. Unpause by using  `%flatnotifs pause`)")
-            user["paused"] = True
-            user_data_changed = True
-        else:
-            try:
-                api_key = fernet.decrypt(user["api_key"].encode()).decode()
-                elements = await aiohttp_manager.read_api(config.notif_api_url, api_key)
-                user["processed_ids"] = deque(reversed([element['id'] for element in elements]), maxlen=config.notif_cache_length)
-                user["paused"] = False
-                user_data_changed = True
-                await ctx.send("Notifications unpaused (You will now resume being notified of notifications. Pause by using  `%flatnotifs pause`)")
-            except Exception as e:
+        async with user["lock"]:
+            if not user["paused"]:
+                await ctx.send("Notifications paused (You will not be notified of any notifications. Unpause by using  `%flatnotifs pause`)")
+                user["paused"] = True
+                mark_changed(user)
+            else:
                 try:
-                    helpers.log(f"Unable to check notifications for user id {user['id']} ({user['object']}):", e)
-                    user["paused"] = True
-                    user_data_changed = True
-                    await ctx.send(config.check_err_msg)
-                except Exception as e2:
-                    raise Exception(
-                        "Error sending 'unable to check notifications on unpause' "
-                        f"message to user id {user['id']} ({user['object']}):", e2
-                    )
+                    api_key = fernet.decrypt(user["api_key"].encode()).decode()
+                    elements = await aiohttp_manager.read_api(config.notif_api_url, api_key)
+                    user["processed_ids"] = polling.new_processed_ids(elements)
+                    if elements:
+                        user["health"].record_success()
+                    user["paused"] = False
+                    mark_changed(user)
+                    await ctx.send("Notifications unpaused (You will now resume being notified of notifications. Pause by using  `%flatnotifs pause`)")
+                except Exception as e:
+                    try:
+                        helpers.log(f"Unable to check notifications for user id {user['id']} ({user['object']}):", e)
+                        user["paused"] = True
+                        mark_changed(user)
+                        await ctx.send(config.check_err_msg)
+                    except Exception as e2:
+                        raise Exception(
+                            "Error sending 'unable to check notifications on unpause' "
+                            f"message to user id {user['id']} ({user['object']}):", e2
+                        )
 
     @bot.command(description="Change your notification send channel to current channel.")
     @is_registered()
     async def sendhere(ctx: commands.Context, mention_flag: str | None = None) -> None:
-        global user_data_changed
         user = get_user(ctx)
         
         if user["sendhere"]["bool"]:
-            user["sendhere"]["bool"] = False
+            async with user["lock"]:
+                user["sendhere"]["bool"] = False
+                mark_changed(user)
             await ctx.send("Successfully changed your notification channel back to default (your DMs)")
-            user_data_changed = True
         else:
             if isinstance(ctx.channel, discord.DMChannel): # Check that it's not DMs
                 await ctx.send("sendhere can only be set in non-DM channels.")
@@ -586,15 +642,16 @@ async def main():
             else:
                 if msg.content.upper() == "Y": # Change user's notification channel
                     try:
-                        user["sendhere"]["channel_id"] = ctx.channel.id
-                        user["channel"] = ctx.channel
-                        user["sendhere"]["mention"] = (mention_flag.lower() == "mention") # Given it was validated, if not mention then nomention
-                        await user["channel"].send(
-                            "Successfully changed your notification channel to this channel. "
-                            "You can disable this at any time using %flatnotifs sendhere"
-                        )
-                        user["sendhere"]["bool"] = True # Don't change bool unless everything went smoothly
-                        user_data_changed = True
+                        async with user["lock"]: # Not held while waiting for the confirmation, so polls carry on
+                            user["sendhere"]["channel_id"] = ctx.channel.id
+                            user["channel"] = ctx.channel
+                            user["sendhere"]["mention"] = (mention_flag.lower() == "mention") # Given it was validated, if not mention then nomention
+                            await user["channel"].send(
+                                "Successfully changed your notification channel to this channel. "
+                                "You can disable this at any time using %flatnotifs sendhere"
+                            )
+                            user["sendhere"]["bool"] = True # Don't change bool unless everything went smoothly
+                            mark_changed(user)
                     except Exception as e:
                         helpers.log(f"Error setting sendhere for user id {user['id']} ({user['object']}):", e)
                         await ctx.send(
@@ -608,7 +665,6 @@ async def main():
     @bot.command(description="Unregister, permanently deleting your rules and API key from the bot.")
     @is_registered()
     async def unregister(ctx: commands.Context) -> None:
-        global user_data_changed
         user = get_user(ctx)
         await ctx.send( # Ask for confirmation
             "Are you sure you want to unregister? (Y/N)\n"
@@ -629,9 +685,11 @@ async def main():
         else:
             if msg.content.upper() == "Y": # Unregister the user
                 try:
-                    user_data.remove(user)
+                    async with user["lock"]: # Wait for any in-progress poll of the user
+                        user_data.remove(user)
+                        user["removed"] = True
+                        dirty_user_ids.add(user["id"])
                     await ctx.send("Successfully unregistered. You can re-register by using the command %flatnotifs getstarted")
-                    user_data_changed = True
                     await bot.change_presence(
                         activity=discord.Game(name=f"%flatnotifs help | Watching {len(user_data)} users' notifs")
                     )
@@ -655,7 +713,6 @@ async def main():
             await ctx.send("Please provide your new personal token.")
             return
         
-        global user_data_changed
         user = get_user(ctx)
         await ctx.send( # Ask for confirmation
             "Are you sure you want to update your personal token? (Y/N)\n"
@@ -687,10 +744,12 @@ async def main():
                     return
                 
                 if elements: # If API key was valid
-                    user["api_key"] = fernet.encrypt(api_key.encode()).decode()
-                    user["processed_ids"] = deque(reversed([element['id'] for element in elements]), maxlen=config.notif_cache_length)
+                    async with user["lock"]: # Don't swap the token mid-poll
+                        user["api_key"] = fernet.encrypt(api_key.encode()).decode()
+                        user["processed_ids"] = polling.new_processed_ids(elements)
+                        user["health"].record_success()
+                        mark_changed(user)
                     await ctx.send("Successfully updated your personal token!")
-                    user_data_changed = True
                     helpers.log(f"User id {user['id']} ({user['object']}) updated token, newest element on startup is ID-{elements[0]['id']}") # DEBUG
                 else:
                     await ctx.send(
@@ -703,7 +762,6 @@ async def main():
     @bot.command(description="Show all rules that you have set.")
     @is_registered()
     async def rules(ctx: commands.Context) -> None:
-        global user_data_changed
         user = get_user(ctx)
         important = { # Only get the usernames
             key: [user_id[0]+user_name for user_id, user_name in values.items()] if key == "actor.username" else values # Add the + or - back to the username
@@ -734,6 +792,46 @@ async def main():
         await aiohttp_manager.refresh_session()
         await ctx.send("Refreshed aiohttp session.")
 
+    @bot.command(description="Show event loop blocking sites and a sampling profile.")
+    @commands.is_owner()
+    async def loopstats(ctx: commands.Context, seconds: float = config.loop_monitor["profile_seconds"]) -> None:
+        if not loop_monitor.running:
+            await ctx.send("Loop monitor is not running (set LOOP_MONITOR to enable blocking site attribution)")
+        await ctx.send(f"Profiling the event loop for {seconds:g} sec...")
+        profile = await loop_monitor.profile(seconds)
+        report = loop_monitor.report(profile)
+        helpers.log(report)
+        await ctx.send(f"```\n{report[:1900]}\n```") # Discord message max length
+
+    @bot.command(description="Show notification latency percentiles per stage.")
+    @commands.is_owner()
+    async def latency(ctx: commands.Context) -> None:
+        await ctx.send(f"```\n{latency_tracker.report()}\n```")
+
+    @bot.command(description="Re-encrypt all personal tokens with the newest Fernet key.")
+    @commands.is_owner()
+    async def rotatekeys(ctx: commands.Context) -> None:
+        global key_rotation_running
+        if key_rotation_running:
+            await ctx.send("Key rotation is already running.")
+            return
+        key_rotation_running = True
+        try:
+            await ctx.send(f"Rotating {len(user_data)} user(s) to the newest key...")
+            result = await keyrotation.rotate_user_keys(user_data, fernet_keys, mark_changed, persist_user_data)
+        except Exception as e:
+            helpers.log("Error during key rotation:", e)
+            await ctx.send(f"Key rotation failed: {e}")
+            return
+        finally:
+            key_rotation_running = False
+        estimate = 10000 / result["per_second"] if result["per_second"] else float("inf")
+        await ctx.send(
+            f"Rotated {result['rotated']} user(s) ({result['failed']} failed) in {result['seconds']:.2f}s "
+            f"({result['per_second']:.0f} users/s, ~{estimate:.0f}s for 10k users). "
+            "Older keys can be removed from FERNET_KEY once no users failed."
+        )
+
     @bot.command(description="Sync the command tree.")
     @commands.is_owner()
     async def sync(ctx: commands.Context) -> None:
@@ -744,12 +842,37 @@ async def main():
     async def hello(ctx: commands.Context) -> None:
         await ctx.send("Hello world!")
 
-    # Start within event loop
-    await bot.start(bot_token)
+    async def load_user_data() -> None:
+        """Download and load the dataset in a thread, timing it."""
+        started = time.perf_counter()
+        dataset = await asyncio.to_thread(datasets.load_dataset, dataset_id, config.datafile_name, hf_api_key)
+        user_data.extend(dataset)
+        for user in user_data:
+            prepare_user(user)
+        user_data_loaded.set()
+        startup_timer.concurrent_phase("dataset_load", time.perf_counter() - started)
+
+    # Start loop monitor (if enabled), keepalive and Discord bot within event loop
+    if loop_monitor_enabled:
+        loop_monitor.start()
+    keepalive_runner = await keepalive.run(is_ready, {
+        "latency": latency_tracker.percentiles,
+        "startup": startup_timer.stats,
+        "api": lambda: aiohttp_manager.stats,
+    })
+    dataset_task = asyncio.create_task(load_user_data()) # Load the dataset while logging in and connecting
+    startup_timer.phase("setup")
+    try:
+        await bot.login(bot_token)
+        startup_timer.phase("login")
+        await asyncio.gather(dataset_task, bot.connect()) # A failed load stops the bot instead of running with no users
+    finally:
+        dataset_task.cancel()
+        if keepalive_runner:
+            await keepalive_runner.cleanup()
 
 if __name__ == "__main__":
-    # Start keepalive and run Discord bot
-    keepalive.run()
+    # Run keepalive and Discord bot
     asyncio.run(main())
 
     # If CTRL-C, clean up
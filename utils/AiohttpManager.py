@@ -6,60 +6,101 @@ import aiohttp
 
 import utils.config as config
 import utils.helpers as helpers
+from utils.transports import AiohttpTransport, Transport
 
 
 class AiohttpManager:
     """
-    The AiohttpManager class manages the aiohttp session.
+    The AiohttpManager class manages the aiohttp session
+    (or whichever transport requests are sent through).
     """
 
-    def __init__(self):
+    def __init__(self, transport: Optional[Transport] = None):
         """
         Initialize the aiohttp manager.
         """
-        self._session = None
+        self._transport = transport or AiohttpTransport()
         self._semaphore = asyncio.Semaphore(config.max_api_load) # Cap API load
+        self._in_flight = {} # (url, api_key): (task of the request in flight, api_key it was sent with)
+        self._cache = {} # (url, api_key): (expiry, result)
+        self.stats = {"requests": 0, "coalesced": 0, "cache_hits": 0}
 
     async def refresh_session(self) -> None:
         """
         Refresh the aiohttp session, or 
         create it if it doesn't exist yet.
         """
-        await self.close_session()
-        self._session = aiohttp.ClientSession()
-        helpers.log("Aiohttp session created.")
+        await self._transport.open()
 
     async def close_session(self) -> None:
         """
         Close the aiohttp session.
         """
-        if self._session:
-            await self._session.close()
-            helpers.log("Aiohttp session closed.")
+        await self._transport.close()
 
-    async def read_api(self, url: str, api_key: Optional[str] = None) -> list[dict]:
+    async def read_api(self, url: str, api_key: Optional[str] = None, cache_ttl: float = 0, per_key: bool = True) -> list[dict]:
         """
-        Get the contents of the api using aiohttp.
+        Get the contents of the api, sharing one request between concurrent
+        identical (url, api_key) calls. Results of idempotent lookups can
+        be cached for cache_ttl seconds. Callers must not mutate the result.
+        If the response doesn't depend on the api_key (per_key=False), requests
+        and cache entries are shared between keys, by url alone; if a shared
+        request fails, callers that joined it with another key retry with their own.
+        """
+        key = (url, api_key if per_key else None)
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached and cached[0] > now:
+            self.stats["cache_hits"] += 1
+            return cached[1]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight:
+            self.stats["coalesced"] += 1
+            task, sent_key = in_flight
+        else:
+            self.stats["requests"] += 1
+            task, sent_key = asyncio.ensure_future(self._request(url, api_key)), api_key
+            self._in_flight[key] = (task, sent_key)
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        try:
+            result = await asyncio.shield(task) # Don't let one cancelled waiter cancel the others
+        except APIRequestError:
+            if sent_key == api_key:
+                raise
+            result = []
+        if not result and sent_key != api_key: # Sent with another caller's key, which may be the one that failed
+            result = await self.read_api(url, api_key)
+
+        if cache_ttl > 0 and result: # Don't cache failures
+            if len(self._cache) >= config.api_cache_size: # Drop expired entries, then the oldest
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+                while len(self._cache) >= config.api_cache_size:
+                    self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = (now + cache_ttl, result)
+        return result
+
+    async def _request(self, url: str, api_key: Optional[str] = None) -> list[dict]:
+        """
+        Get the contents of the api through the transport.
         Ignores fail status codes other than 401.
         """
-        if not self._session:
+        if not self._transport.opened:
             raise ValueError("Session not initialized")
 
         try:
             headers = {"Authorization": f"Bearer {api_key}"} if api_key else None
             async with self._semaphore:
-                async with self._session.get(url, headers=headers) as response:
-                    if response.status in {401, 404}: # invalid API key or user not found
-                        try:
-                            response.raise_for_status() # force an exception to get e
-                        except aiohttp.ClientResponseError as e:
-                            helpers.log(e)
-                        return [] # empty dict = fail
+                response = await self._transport.get(url, headers=headers)
+            if response.status in {401, 404}: # invalid API key or user not found
+                helpers.log(f"{response.status}, url='{url}'")
+                return [] # empty dict = fail
 
-                    response.raise_for_status()
-                    # resp_headers = response.headers
-                    # helpers.log(f"Rate limit remaining for key {api_key[-4:]}: {resp_headers.get('X-RateLimit-Remaining')}/{resp_headers.get('X-RateLimit-Limit')}, resets in {((int(resp_headers.get('X-RateLimit-Reset')) - time.time())/60):.2f} minutes") # DEBUG
-                    return await response.json()
+            if response.status >= 400:
+                raise APIRequestError("API request error (do not act):", f"{response.status}, url='{url}'")
+            # resp_headers = response.headers
+            # helpers.log(f"Rate limit remaining for key {api_key[-4:]}: {resp_headers.get('X-RateLimit-Remaining')}/{resp_headers.get('X-RateLimit-Limit')}, resets in {((int(resp_headers.get('X-RateLimit-Reset')) - time.time())/60):.2f} minutes") # DEBUG
+            return response.body
 
         except aiohttp.ClientError as e: # ignore edge case http codes
             raise APIRequestError("API request error (do not act):", e)
@@ -0,0 +1,138 @@
+import re
+from typing import Iterable
+
+
+_WORD = re.compile(r"\w+") # words of the text being matched
+_PATTERN_WORD = re.compile(r"[\w*?]+") # words of a pattern, which may contain glob wildcards
+_GLOB_PREFIX = re.compile(r"[^*?]*") # literal characters of a glob before its first wildcard
+
+
+class _Node:
+    """
+    A node of the word trie; children are keyed by literal word, globs are
+    indexed by their literal prefix so a word is only tested against the
+    globs it could match.
+    """
+
+    def __init__(self):
+        self.children = {}
+        self.globs = {} # glob: child node
+        self.glob_index = {} # character trie of glob prefixes, "" holds the (regex, child) of globs ending there
+        self.rules = [] # rules (e.g. "+piano") that end at this node
+
+    def compile(self) -> None:
+        """
+        Build the glob prefix index (e.g. "moon*" is filed under m-o-o-n,
+        so it's only tested against words starting with "moon").
+        """
+        self.glob_index = {}
+        for glob, child in self.globs.items():
+            index = self.glob_index
+            for char in _GLOB_PREFIX.match(glob).group():
+                index = index.setdefault(char, {})
+            index.setdefault("", []).append((re.compile(_glob_to_regex(glob)), child))
+        for child in self.children.values():
+            child.compile()
+        for child in self.globs.values():
+            child.compile()
+
+    def match_globs(self, word: str) -> list["_Node"]:
+        """
+        Get the children of the globs matching word, walking the prefix index
+        along the word so the cost depends on the word and not on the number of globs.
+        """
+        nodes = []
+        index = self.glob_index
+        for char in word:
+            nodes += [child for regex, child in index.get("", ()) if regex.fullmatch(word)]
+            index = index.get(char)
+            if index is None:
+                return nodes
+        nodes += [child for regex, child in index.get("", ()) if regex.fullmatch(word)]
+        return nodes
+
+
+def _glob_to_regex(glob: str) -> str:
+    """
+    Convert a glob word to a regex; * matches any word characters and ? matches one.
+    """
+    return "".join(
+        r"\w*" if char == "*" else r"\w" if char == "?" else re.escape(char)
+        for char in glob
+    )
+
+
+class KeywordMatcher:
+    """
+    The KeywordMatcher class matches keyword rules against text using a
+    precompiled word trie, so the cost per text doesn't grow with the number of rules.
+    """
+
+    def __init__(self, rules: Iterable[str]):
+        """
+        Build the matcher from rules in the form +pattern or -pattern,
+        where pattern is one or more words that may contain * and ? wildcards.
+        """
+        self._root = _Node()
+        self._depth = 0 # words in the longest pattern
+        for rule in rules:
+            words = _PATTERN_WORD.findall(rule[1:].lower())
+            if not words:
+                continue
+            node = self._root
+            for word in words:
+                branch = node.globs if ("*" in word or "?" in word) else node.children
+                node = branch.setdefault(word, _Node())
+            node.rules.append(rule)
+            self._depth = max(self._depth, len(words))
+        self._root.compile()
+
+    def _step(self, node: _Node, word: str) -> list[_Node]:
+        """
+        Get the children of node that match word.
+        """
+        nodes = []
+        child = node.children.get(word)
+        if child:
+            nodes.append(child)
+        if node.glob_index:
+            nodes += node.match_globs(word)
+        return nodes
+
+    def match(self, texts: Iterable[str]) -> list[str]:
+        """
+        Get the rules matching any of the texts (case-insensitive, whole words), in order of first match.
+        """
+        matched = {}
+        if not self._depth:
+            return []
+        for text in texts:
+            words = _WORD.findall(text.lower())
+            for start in range(len(words)):
+                nodes = [self._root]
+                for word in words[start:start + self._depth]:
+                    nodes = [child for node in nodes for child in self._step(node, word)]
+                    if not nodes:
+                        break
+                    for node in nodes:
+                        matched.update(dict.fromkeys(node.rules))
+        return list(matched)
+
+
+def keyword_texts(element: dict) -> list[str]:
+    """
+    Get the texts of a notification element that keyword rules are matched against
+    (the score title and the comment text, if present; the comment is only
+    an object when expanded, see config.notif_api_url).
+    """
+    texts = []
+    attachments = element.get("attachments") or {}
+    score = attachments.get("score")
+    if isinstance(score, dict) and isinstance(score.get("title"), str):
+        texts.append(score["title"])
+    comment = attachments.get("scoreComment")
+    if isinstance(comment, dict):
+        text = comment.get("rawComment") or comment.get("comment")
+        if isinstance(text, str):
+            texts.append(text)
+    return texts
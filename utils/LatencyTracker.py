@@ -0,0 +1,83 @@
+from collections import deque
+from datetime import datetime
+import time
+
+import utils.config as config
+
+
+# Stage timestamps recorded per notification, in pipeline order
+STAGES = ("created", "fetched", "decided", "sent", "acked")
+
+# Spans reported as latencies: span name: (start stage, end stage)
+SPANS = {
+    "fetch": ("created", "fetched"), # Flat creating the notification -> poll fetching it
+    "decide": ("fetched", "decided"), # poll fetch -> rule decision
+    "send": ("decided", "sent"), # rule decision -> message handed to Discord
+    "ack": ("sent", "acked"), # message handed to Discord -> Discord ack
+    "total": ("created", "acked"), # end to end
+}
+
+
+class LatencyTracker:
+    """
+    The LatencyTracker class aggregates per-stage notification latencies.
+    """
+
+    def __init__(self):
+        """
+        Initialize the latency tracker.
+        """
+        self._samples = {span: deque(maxlen=config.latency_samples) for span in SPANS}
+
+    @staticmethod
+    def trace(element: dict, fetched_at: float) -> dict[str, float]:
+        """
+        Start a trace for a notification element fetched at fetched_at (epoch seconds).
+        """
+        trace = {"fetched": fetched_at}
+        try: # Flat dates are ISO 8601 in UTC, e.g. 2025-04-04T12:00:00.000Z
+            trace["created"] = datetime.fromisoformat(element["date"].replace("Z", "+00:00")).timestamp()
+        except (KeyError, AttributeError, ValueError):
+            pass
+        return trace
+
+    @staticmethod
+    def mark(trace: dict[str, float], stage: str) -> None:
+        """
+        Timestamp a stage of the trace.
+        """
+        trace[stage] = time.time()
+
+    def record(self, trace: dict[str, float]) -> None:
+        """
+        Record every span that the trace has both stages for.
+        """
+        for span, (start, end) in SPANS.items():
+            if start in trace and end in trace:
+                self._samples[span].append(trace[end] - trace[start])
+
+    def percentiles(self) -> dict[str, dict[str, float]]:
+        """
+        Get count, p50, p90, p99 and max (in seconds) of each span.
+        """
+        stats = {}
+        for span, samples in self._samples.items():
+            ordered = sorted(samples)
+            if not ordered:
+                stats[span] = {"count": 0}
+                continue
+            stats[span] = {"count": len(ordered)}
+            for p in config.latency_percentiles:
+                stats[span][f"p{p}"] = ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+            stats[span]["max"] = ordered[-1]
+        return stats
+
+    def report(self) -> str:
+        """
+        Summarize span percentiles as text.
+        """
+        lines = []
+        for span, stats in self.percentiles().items():
+            values = ", ".join(f"{key} {value:.2f}s" for key, value in stats.items() if key != "count")
+            lines.append(f"{span}: n={stats['count']}{', ' + values if values else ''}")
+        return "\n".join(lines)
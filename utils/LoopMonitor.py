@@ -0,0 +1,153 @@
+import asyncio
+from collections import Counter
+import os
+import sys
+import threading
+import time
+import traceback
+
+import utils.config as config
+import utils.helpers as helpers
+
+
+class LoopMonitor:
+    """
+    The LoopMonitor class samples event loop lag and attributes
+    blocking calls to the stack that was running on the loop.
+    """
+
+    def __init__(self):
+        """
+        Initialize the loop monitor.
+        """
+        self._loop = None
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+        self._last_beat = time.perf_counter()
+        self.lag_samples = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.blocking_sites = Counter() # site: seconds spent blocking the loop
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """
+        Start sampling loop lag and watching for blocking calls.
+        Must be called from within the running event loop.
+        """
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._last_beat = time.perf_counter()
+        self._task = self._loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="LoopMonitor", daemon=True)
+        self._watchdog.start()
+        helpers.log("Loop monitor started.")
+
+    def stop(self) -> None:
+        """
+        Stop the loop monitor.
+        """
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        helpers.log("Loop monitor stopped.")
+
+    async def _heartbeat(self) -> None:
+        """
+        Sleep for the sample interval and record how late the loop woke up.
+        """
+        interval = config.loop_monitor["sample_interval"]
+        while True:
+            start = time.perf_counter()
+            self._last_beat = start
+            await asyncio.sleep(interval)
+            lag = max(time.perf_counter() - start - interval, 0.0)
+            self.lag_samples += 1
+            self.lag_total += lag
+            self.lag_max = max(self.lag_max, lag)
+
+    def _watch(self) -> None:
+        """
+        Watchdog thread; while the heartbeat is overdue, repeatedly capture
+        the loop thread's stack and charge the elapsed time to its site.
+        """
+        interval = config.loop_monitor["sample_interval"]
+        threshold = config.loop_monitor["block_threshold"]
+        stall_start = None
+        stall_site = None
+        while not self._stop.wait(interval):
+            overdue = time.perf_counter() - self._last_beat - interval
+            if overdue > threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                stall_site = self._site(frame)
+                self.blocking_sites[stall_site] += interval
+                if stall_start is None:
+                    stall_start = self._last_beat
+            elif stall_start is not None: # Stall ended, log where it happened
+                helpers.log(
+                    f"Event loop blocked for {(time.perf_counter() - stall_start - interval):.3f}s at {stall_site}",
+                    error=True
+                )
+                stall_start = None
+                stall_site = None
+
+    @staticmethod
+    def _site(frame) -> str:
+        """
+        Describe a frame by its innermost call sites, preferring frames from this project.
+        """
+        stack = traceback.extract_stack(frame)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        own = [f for f in stack if f.filename.startswith(root)]
+        innermost = stack[-1]
+        site = f"{os.path.basename(innermost.filename)}:{innermost.lineno} {innermost.name}"
+        if own and own[-1] is not innermost:
+            site = f"{os.path.basename(own[-1].filename)}:{own[-1].lineno} {own[-1].name} -> {site}"
+        return site
+
+    async def profile(self, seconds: float) -> Counter:
+        """
+        Sample the loop thread's stack for the given number of seconds
+        (without blocking the loop) and count the sites seen.
+        """
+        thread_id = self._loop_thread_id or threading.get_ident()
+        interval = 1 / config.loop_monitor["profile_hz"]
+
+        def sample() -> Counter:
+            samples = Counter()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    samples[self._site(frame)] += 1
+                time.sleep(interval)
+            return samples
+
+        return await asyncio.to_thread(sample)
+
+    def report(self, profile: Counter | None = None, top: int = 10) -> str:
+        """
+        Summarize loop lag, the top blocking sites and (optionally) a sampling profile.
+        """
+        mean_lag = (self.lag_total / self.lag_samples) if self.lag_samples else 0.0
+        lines = [
+            f"Loop lag: mean {mean_lag * 1000:.1f}ms, max {self.lag_max * 1000:.1f}ms over {self.lag_samples} samples",
+            "Top blocking sites:"
+        ]
+        lines += [f"  {seconds:.2f}s  {site}" for site, seconds in self.blocking_sites.most_common(top)] or ["  (none)"]
+        if profile is not None:
+            total = sum(profile.values()) or 1
+            lines.append(f"Sampling profile ({total} samples):")
+            lines += [f"  {count / total:6.1%}  {site}" for site, count in profile.most_common(top)]
+        return "\n".join(lines)
@@ -0,0 +1,46 @@
+import time
+
+import utils.helpers as helpers
+
+
+class StartupTimer:
+    """
+    The StartupTimer class measures the phases of a cold start.
+    """
+
+    def __init__(self, started: float):
+        """
+        Initialize the startup timer from a time.perf_counter() reading.
+        """
+        self._started = started
+        self._last = started
+        self.phases = {} # phase: seconds
+        self.ready = None # seconds from start to ready
+
+    def phase(self, name: str) -> None:
+        """
+        End a phase, timing it from the end of the previous one.
+        """
+        now = time.perf_counter()
+        self.phases[name] = now - self._last
+        self._last = now
+        helpers.log(f"Startup phase {name} took {self.phases[name]:.2f}s")
+
+    def concurrent_phase(self, name: str, seconds: float) -> None:
+        """
+        Record a phase that ran concurrently with the others.
+        """
+        self.phases[name] = seconds
+        helpers.log(f"Startup phase {name} took {seconds:.2f}s (concurrent)")
+
+    def mark_ready(self) -> None:
+        """
+        Record the time from start to ready, only the first time the bot becomes ready.
+        """
+        if self.ready is None:
+            self.ready = time.perf_counter() - self._started
+            rss = helpers.rss_mb()
+            helpers.log(f"Import to ready took {self.ready:.2f}s{f' (RSS {rss:.1f} MB)' if rss else ''}")
+
+    def stats(self) -> dict:
+        return {"phases": self.phases, "ready": self.ready, "rss_mb": helpers.rss_mb()}
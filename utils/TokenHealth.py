@@ -0,0 +1,52 @@
+import time
+from typing import Callable
+
+import utils.config as config
+
+
+class TokenHealth:
+    """
+    The TokenHealth class tracks a user's failed polls, backing off
+    exponentially and quarantining tokens that keep failing.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize a healthy token.
+        """
+        self._clock = clock
+        self.failures = 0 # consecutive failures
+        self.next_attempt = 0.0 # clock time of the next allowed poll
+        self.quarantined = False
+
+    def due(self) -> bool:
+        """
+        Whether the token should be polled now.
+        """
+        return self._clock() >= self.next_attempt
+
+    def record_success(self) -> bool:
+        """
+        Reset after a successful poll.
+        Returns True if the token was quarantined and is now restored.
+        """
+        restored = self.quarantined
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.quarantined = False
+        return restored
+
+    def record_failure(self) -> bool:
+        """
+        Back off after a failed poll, probing on a slow schedule once quarantined.
+        Returns True if the token was just quarantined.
+        """
+        self.failures += 1
+        newly_quarantined = not self.quarantined and self.failures >= config.token_health["quarantine_after"]
+        self.quarantined = self.quarantined or newly_quarantined
+        if self.quarantined:
+            delay = config.token_health["quarantine_probe"]
+        else:
+            delay = min(config.token_health["backoff_base"] * 2 ** (self.failures - 1), config.token_health["backoff_max"])
+        self.next_attempt = self._clock() + delay
+        return newly_quarantined
@@ -0,0 +1,170 @@
+"""
+discord.py client options for the memory profiles in config.client_profiles,
+and an offline measurement of each profile's caches under a guild-heavy load.
+
+The measurement feeds synthetic GUILD_CREATE, member chunk and MESSAGE_CREATE
+payloads into each profile's connection state (in a separate process per
+profile) and reports RSS before and after. Usage:
+
+    python -m utils.clientprofiles --guilds 50 --members 1000 --messages 5000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import subprocess
+import sys
+
+import discord
+from discord.ext import commands
+
+import utils.config as config
+import utils.helpers as helpers
+
+
+def client_options(profile: dict) -> dict:
+    """
+    Get the discord.py Client options of a profile from config.client_profiles.
+    """
+    if profile["lean_intents"]: # Only guild channels and guild/DM messages
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.guild_messages = True
+        intents.dm_messages = True
+    else:
+        intents = discord.Intents.default()
+    intents.message_content = True
+    chunk_guilds = profile["chunk_guilds_at_startup"]
+    return {
+        "intents": intents,
+        "max_messages": profile["max_messages"],
+        "member_cache_flags": (
+            discord.MemberCacheFlags.from_intents(intents)
+            if profile["member_cache"] else discord.MemberCacheFlags.none()
+        ),
+        # discord.py only allows chunking with the members intent
+        "chunk_guilds_at_startup": intents.members if chunk_guilds is None else chunk_guilds,
+    }
+
+
+def _member(guild: int, n: int) -> dict:
+    return {
+        "user": {"id": str(10**17 + guild * 10**6 + n), "username": f"member{n}", "discriminator": "0", "global_name": f"Member {n}", "avatar": None},
+        "roles": [],
+        "joined_at": "2025-04-04T12:00:00.000000+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+def _guild(guild: int, members: int, channels: int, send_members: int) -> dict:
+    """
+    A GUILD_CREATE payload with the first send_members members (Discord only sends
+    members with the members intent, and only up to the large threshold).
+    """
+    guild_id = str(10**16 + guild)
+    return {
+        "id": guild_id,
+        "name": f"Guild {guild}",
+        "owner_id": str(10**17),
+        "member_count": members,
+        "large": members > 250,
+        "roles": [{"id": guild_id, "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False, "flags": 0}],
+        "channels": [
+            {"id": str(10**16 + guild * 1000 + c), "type": 0, "name": f"channel-{c}", "position": c, "permission_overwrites": []}
+            for c in range(channels)
+        ],
+        "members": [_member(guild, n) for n in range(send_members)],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "threads": [],
+        "voice_states": [],
+        "presences": [],
+    }
+
+def _message(guild: int, channel: int, n: int, author: int) -> dict:
+    member = _member(guild, author)
+    return {
+        "id": str(10**18 + n),
+        "channel_id": str(10**16 + guild * 1000 + channel),
+        "guild_id": str(10**16 + guild),
+        "author": dict(member["user"], bot=True), # So commands.Bot skips them after caching
+        "member": {key: value for key, value in member.items() if key != "user"},
+        "content": f"Just finished the second movement, what do you think? #{n}",
+        "timestamp": "2025-04-04T12:00:00.000000+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+async def _load(bot: commands.Bot, guilds: int, members: int, channels: int, messages: int) -> None:
+    """
+    Feed the synthetic gateway load into the bot's connection state, like on connecting to a guild-heavy bot.
+    """
+    state = bot._connection
+    for g in range(guilds):
+        sent = min(members, 250) if state._intents.members else 0
+        guild = state._add_guild_from_data(_guild(g, members, channels, sent))
+        if state._chunk_guilds and state.member_cache_flags.joined: # Chunking caches the remaining members
+            for n in range(sent, members):
+                guild._add_member(discord.Member(data=_member(g, n), guild=guild, state=state))
+    if state._intents.guild_messages:
+        for n in range(messages):
+            state.parse_message_create(_message(n % guilds, n % channels, n, n % members))
+            if n % 100 == 0:
+                await asyncio.sleep(0) # Let the dispatched on_message tasks finish
+
+async def measure(name: str, guilds: int, members: int, channels: int, messages: int) -> dict:
+    """
+    Get the RSS (MB) and cached object counts of a profile before and after the synthetic load.
+    """
+    async with commands.Bot(command_prefix="%flatnotifs ", help_command=None, **client_options(config.client_profiles[name])) as bot:
+        gc.collect()
+        before = helpers.rss_mb()
+        await _load(bot, guilds, members, channels, messages)
+        gc.collect()
+        after = helpers.rss_mb()
+        return {
+            "rss_before_mb": before,
+            "rss_after_mb": after,
+            "rss_delta_mb": after - before if before is not None and after is not None else None,
+            "guilds": len(bot.guilds),
+            "members": sum(len(guild.members) for guild in bot.guilds),
+            "users": len(bot.users),
+            "messages": len(bot.cached_messages),
+        }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the memory of each client profile under a synthetic guild-heavy load.")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--members", type=int, default=1000, help="members per guild")
+    parser.add_argument("--channels", type=int, default=20, help="text channels per guild")
+    parser.add_argument("--messages", type=int, default=5000, help="guild messages received")
+    parser.add_argument("--profile", help="measure one profile in this process and print JSON (used per profile)")
+    args = parser.parse_args()
+    load = [str(args.guilds), str(args.members), str(args.channels), str(args.messages)]
+
+    if args.profile:
+        print(json.dumps(asyncio.run(measure(args.profile, *map(int, load)))))
+        return
+
+    for name in config.client_profiles: # A fresh process per profile, so RSS isn't shared between them
+        output = subprocess.run(
+            [sys.executable, "-m", "utils.clientprofiles", "--profile", name,
+             "--guilds", load[0], "--members", load[1], "--channels", load[2], "--messages", load[3]],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results = json.loads(output.strip().splitlines()[-1])
+        print(f"{name}:")
+        for key, value in results.items():
+            print(f"  {key}: {value:.1f}" if isinstance(value, float) else f"  {key}: {value}")
+
+if __name__ == "__main__":
+    main()
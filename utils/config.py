@@ -1,8 +1,25 @@
 host = "0.0.0.0"
 port = 7860
+ready_tick_tolerance = 2 # /ready fails if check_notifs_loop hasn't ticked within this many loop intervals
 
 datafile_name = "data.json"
 
+# discord.py client memory profiles, selected with the MEMORY_PROFILE environment variable
+client_profiles = {
+    "default": { # discord.py defaults
+        "lean_intents": False, # default intents (plus message_content)
+        "max_messages": 1000, # message cache size
+        "member_cache": True, # cache members according to intents
+        "chunk_guilds_at_startup": None, # discord.py default: chunk if the members intent is enabled
+    },
+    "lean": { # only what Flat Notifs uses: guild channels, guild/DM messages and message content
+        "lean_intents": True,
+        "max_messages": None,
+        "member_cache": False,
+        "chunk_guilds_at_startup": False,
+    },
+}
+
 # FIXME: As you scale, cap load at 20 and 15 sec per user might be too slow
 max_api_load = 20
 delay_amounts = {
@@ -11,15 +28,52 @@ delay_amounts = {
     "per_user_startup": 10, # seconds
     "per_convert": 0.5, # seconds
 }
+render_cache_size = 1024 # escaped actor names/types kept when rendering notifications
+latency_samples = 1000 # per span, most recent notification latencies kept for percentiles
+latency_percentiles = (50, 90, 99)
+token_health = { # Backoff for users whose notifications can't be checked
+    "backoff_base": 60, # seconds to wait after the first failure, doubled per consecutive failure
+    "backoff_max": 30 * 60, # seconds
+    "quarantine_after": 6, # consecutive failures before quarantining the token
+    "quarantine_probe": 6 * 60 * 60, # seconds between probes of a quarantined token
+}
+key_rotation = { # Used by the rotatekeys command
+    "batch_size": 500, # tokens re-encrypted per worker task
+    "workers": 4, # batches in flight at once, the dataset is updated after each round
+    "executor": "thread", # thread or process pool (spawned workers, which re-import the main module)
+}
+loop_monitor = { # Only used if the LOOP_MONITOR environment variable is set
+    "sample_interval": 0.05, # seconds between loop lag samples
+    "block_threshold": 0.1, # seconds the loop must be stalled for to be attributed as blocking
+    "profile_seconds": 5, # default length of the loopstats sampling profile
+    "profile_hz": 100, # stack samples per second during the sampling profile
+}
+membench = { # Used by the allocation regression benchmark (python -m utils.membench)
+    "users": 200, # synthetic users polled per cycle
+    "new_per_poll": 2, # new notifications per user per cycle
+    "warmup_cycles": 50, # cycles run before measuring, so caches and deques are full
+    "cycles": 50, # measured cycles
+    "tolerance": 0.1, # fraction over the stored baseline allowed before failing
+    "slack_bytes": 64, # also allowed over the baseline, for metrics that are ~0 (e.g. retained bytes)
+}
 """
 NOTE: As of 4/4/25, rate limits are as follows:
 With API key: 7200 / hour / user
 Without API key: 1800 / hour / all anonymous users
 """
+flat_rate_limits = { # Used by the capacity simulator (see NOTE above)
+    "per_user_per_hour": 7200,
+    "anonymous_per_hour": 1800,
+}
+
+api_cache_ttls = { # seconds to cache idempotent API lookups for
+    "user_lookup": 10 * 60, # username <-> id conversions
+}
+api_cache_size = 1000 # max cached API lookups
 
 # FIXME: What if more than 15 notifications were sent within the loop interval?
 notif_cache_length = 15
-notif_api_url = f"https://api.flat.io/v2/me/notifications?expand=actor,score&returnOptInScoresInvitations=true&limit={notif_cache_length}"
+notif_api_url = f"https://api.flat.io/v2/me/notifications?expand=actor,score,scoreComment&returnOptInScoresInvitations=true&limit={notif_cache_length}"
 user_api_url = "https://api.flat.io/v2/users/{identifier}"
 discord_url = "https://discord.gg/s5xXz8Nfun"
 
@@ -38,6 +92,15 @@ check_err_msg = """
 (Automatically pausing to avoid spamming; you can use  `%flatnotifs pause`  to unpause)
 """
 
+quarantine_msg = """
+[DEBUG]: Unable to check your notifications after several tries! Did you delete your personal token? (If not, this is probably just a result of a server error)
+(Checking every few hours until it works again; you can use  `%flatnotifs updatetoken`  if your token changed)
+"""
+
+restored_msg = """
+[DEBUG]: Your notifications can be checked again! (Resuming normal checks)
+"""
+
 channel_err_msg = """
 [DEBUG]: Unable to find your specified channel! Was the channel deleted, or did the bot lose access to it?
 (Defaulting to DMs to avoid spamming; you can use  `%flatnotifs sendhere`  again to pick a channel to send notifications)
@@ -53,7 +116,7 @@ Note that getstarted can only be used in DMs. Remember to never send your person
 help_msg = [ f"""
 **Help**
 
-Welcome to Flat Notifs! This a bot that sends your Flat notifications directly to your Discord DMs or a channel in a server that you specify (that this bot has been added to)! In addition, it allows you to filter by user, notification type, and score id.
+Welcome to Flat Notifs! This a bot that sends your Flat notifications directly to your Discord DMs or a channel in a server that you specify (that this bot has been added to)! In addition, it allows you to filter by user, notification type, score id, and keyword.
 
 **Available commands:**
 `%flatnotifs addrule include/exclude category value`  (Add a rule. More than one value can be specified, seperated by spaces)
@@ -73,6 +136,7 @@ f"""
 `actor.username`  (Flat.io username, without the @ sign. e.g. `actor.username flat`)
 `type`  (Type of notification. Options: scorePublish, scoreComment, scoreStar, userFollow. e.g. `type userFollow`)
 `attachments.score.id`  (id of a score, without the name. e.g. `attachments.score.id 623f2fab79ac0e0012b95dc8`)
+`keyword`  (Word or phrase to look for in score titles and comment text, not case sensitive. Use * to match any letters and quotes around phrases. e.g. `keyword piano "moonlight sonat*"`)
 
 *Answer not here, have feedback, or want to help with development? Join the bot's [Discord server](<{discord_url}>)!*
 *(Go there to contact the developer, as well as to get access to the full patch notes, TODO, and known issues lists!)*
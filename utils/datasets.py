@@ -1,20 +1,48 @@
+import itertools
 import json
 import os
-
-from huggingface_hub import HfApi, hf_hub_download
+import textwrap
 
 import utils.helpers as helpers
 
 
-def update_dataset(data: list[dict], dataset_id: str, filename: str, hf_api_key: str) -> None:
+runtime_keys = {"object", "processed_ids", "channel", "matcher", "health", "lock", "version", "removed"} # Per-user properties that aren't persisted
+_versions = itertools.count() # Shared by all users, so a user who re-registers never gets a version cached for their old record
+
+def new_version() -> int:
+    """
+    Get a user version for serialize_users, never handed out before.
+    """
+    return next(_versions)
+
+def serialize_users(users: list[dict], records: dict[str, tuple[int, str]]) -> list[str]:
+    """
+    Serialize users (without their runtime properties) for update_dataset.
+    records caches user id: (version, JSON), so only users whose version
+    (from new_version()) changed since the last call are serialized again;
+    removed users are dropped.
+    """
+    serialized = []
+    for user in users:
+        record = records.get(user["id"])
+        if record is None or record[0] != user["version"]:
+            persisted = {key: value for key, value in user.items() if key not in runtime_keys}
+            record = records[user["id"]] = (user["version"], json.dumps(persisted, indent=4))
+        serialized.append(record[1])
+    for user_id in records.keys() - {user["id"] for user in users}:
+        del records[user_id]
+    return serialized
+
+def update_dataset(serialized: list[str], dataset_id: str, filename: str, hf_api_key: str) -> None:
     """
-    Update a HF dataset.
+    Update a HF dataset with users from serialize_users().
     """
-    # Filter data and then dump into a data.json file
+    # Write the users into a data.json file (formatted like json.dump(users, indent=4))
     with open(filename, "w") as file:
-        json.dump(data, file, indent=4)
+        file.write("[\n" + ",\n".join(textwrap.indent(user, "    ") for user in serialized) + "\n]" if serialized else "[]")
 
-    # Upload data.json to the HF dataset
+    # Upload data.json to the HF dataset (imported lazily to keep cold start fast)
+    from huggingface_hub import HfApi
     api = HfApi()
     api.upload_file(
         path_or_fileobj=filename, # the file to upload
@@ -37,7 +65,8 @@ def load_dataset(dataset_id: str, filename: str, hf_api_key: str | None = None)
     except OSError:
       pass
     
-    # Try to download and load the file
+    # Try to download and load the file (imported lazily to keep cold start fast)
+    from huggingface_hub import hf_hub_download
     try:
         hf_hub_download(
             filename=filename, # The file to download
@@ -0,0 +1,84 @@
+from utils.KeywordMatcher import KeywordMatcher, keyword_texts
+import utils.helpers as helpers
+
+
+def copy_rules(important: dict) -> dict:
+    """
+    Copy a user's rules so they can be changed without affecting
+    evaluations that are using the current rules (copy-on-write).
+    """
+    return {category: values.copy() for category, values in important.items()}
+
+def evaluate(element: dict, important: dict, matcher: KeywordMatcher, override: bool) -> tuple[bool, list[str], list[tuple[str, str, str]]]:
+    """
+    Evaluate a user's rules against a notification element without changing them.
+    Returns whether the element is important, the triggered rules, and
+    (category, rule, username) for actor.username rules whose username changed.
+    """
+    is_important = False
+    excluded = False
+    triggered_rules = []
+    renames = []
+    for category, values in important.items():
+        if category == "keyword": # Matched against score titles and comment text instead of a value
+            matched = matcher.match(keyword_texts(element))
+            exclusions = [rule for rule in matched if rule[0] == "-"]
+            inclusions = [rule for rule in matched if rule[0] == "+"]
+            if exclusions:
+                excluded = True
+                triggered_rules += [category + ": " + rule for rule in exclusions]
+                if not override:
+                    break
+            if inclusions:
+                if not excluded:
+                    is_important = True
+                triggered_rules += [category + ": " + rule for rule in inclusions]
+            continue
+
+        nested_category = ("actor.id" if category == "actor.username" else category).split('.') # split by dots
+
+        # Iterate until you reach the bottom nested category; if not found, continue to next rule
+        value = element
+        for k in nested_category:
+            value = value.get(k, None)
+            if value is None:
+                break
+        if value is None:
+            continue
+
+        for sign in ("-", "+"): # Check if excluded, then if included
+            rule = sign + value
+            if rule not in values:
+                continue
+            if category == "actor.username": # If actor.username, show (and keep up to date) the username
+                val = values[rule]
+                if val != element['actor']['username']: # Update username if changed
+                    helpers.log("Updated", val, "to", element['actor']['username']) # DEBUG
+                    val = element['actor']['username']
+                    renames.append((category, rule, val))
+            else:
+                val = value
+            triggered_rules.append(category + ": " + sign + val)
+
+            if sign == "-":
+                excluded = True
+                if not override:
+                    break
+            elif not excluded:
+                is_important = True
+        else:
+            continue
+        break # Excluded and not overridden
+
+    return is_important, triggered_rules, renames
+
+def apply_renames(important: dict, renames: list[tuple[str, str, str]]) -> dict:
+    """
+    Get a copy of the rules with the renames from evaluate() applied
+    (skipping rules that have since been removed).
+    """
+    important = copy_rules(important)
+    for category, rule, username in renames:
+        if rule in important.get(category, {}):
+            important[category][rule] = username
+    return important
@@ -1,4 +1,5 @@
 from datetime import datetime
+import os
 
 
 def log(*args, **kwargs) -> None:
@@ -15,11 +16,21 @@ def log(*args, **kwargs) -> None:
         **kwargs
     ) # [2025-3-1, 7:11:30] - Hello world!
 
+def rss_mb() -> float | None:
+    """
+    Get the current resident set size of this process in MB (Linux only).
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+escape_chars = ['*', '_', '~', '`', '|', '>', '[', ']', '(', ')', '#', '-', '+', '.']
+escape_table = str.maketrans({char: f'\\{char}' for char in escape_chars}) # e.g. map * to \*
+
 def esc_md(text: str) -> str:
     """
-    Escape markdown.
+    Escape markdown in a single pass.
     """
-    escape_chars = ['*', '_', '~', '`', '|', '>', '[', ']', '(', ')', '#', '-', '+', '.']
-    for char in escape_chars:
-        text = text.replace(char, f'\\{char}') # e.g. replace * with \*
-    return text
\ No newline at end of file
+    return text.translate(escape_table)
\ No newline at end of file
@@ -1,23 +1,56 @@
-from threading import Thread
+from typing import Callable, Optional
 
-from flask import Flask
+from aiohttp import web
 
 import utils.config as config
+import utils.helpers as helpers
 
 
-# Instantiate Flask app
-flask_app = Flask(__name__)
+is_ready_key = web.AppKey("is_ready", Callable[[], bool])
+stats_key = web.AppKey("stats", dict[str, Callable[[], dict]])
 
-@flask_app.route("/", methods=["GET"])
-def home() -> str:
-    return "I'm alive"
 
-def run() -> None:
+async def home(request: web.Request) -> web.Response:
+    return web.Response(text="I'm alive")
+
+async def ready(request: web.Request) -> web.Response:
+    """
+    Report whether the bot is ready (i.e. check_notifs_loop is ticking).
+    """
+    if request.app[is_ready_key]():
+        return web.Response(text="Ready")
+    return web.Response(text="Not ready", status=503)
+
+async def stats(request: web.Request) -> web.Response:
+    """
+    Report a named set of stats as JSON.
+    """
+    getter = request.app[stats_key].get(request.match_info["name"])
+    if getter is None:
+        raise web.HTTPNotFound()
+    return web.json_response(getter())
+
+async def run(is_ready: Callable[[], bool], stats_getters: Optional[dict[str, Callable[[], dict]]] = None) -> Optional[web.AppRunner]:
     """
-    Run Flask app in a daemon thread
+    Run the keepalive aiohttp app on the running event loop,
+    serving each of stats_getters at /stats/{name}.
+    Returns the runner so it can be cleaned up on shutdown, or None if the
+    port couldn't be bound (logged, so the bot still starts without it).
     """
-    def flask_run() -> None:
-        flask_app.run(host=config.host, port=config.port)
+    app = web.Application()
+    app[is_ready_key] = is_ready
+    app[stats_key] = stats_getters or {}
+    app.router.add_get("/", home)
+    app.router.add_get("/ready", ready)
+    app.router.add_get("/stats/{name}", stats)
 
-    flask_thread = Thread(target=flask_run, daemon=True)
-    flask_thread.start()
\ No newline at end of file
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.host, port=config.port)
+    try:
+        await site.start()
+    except OSError as e: # e.g. the port is already in use
+        helpers.log(f"Unable to start keepalive on {config.host}:{config.port}, continuing without it:", e, error=True)
+        await runner.cleanup()
+        return None
+    return runner
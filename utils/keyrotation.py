@@ -0,0 +1,75 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import time
+from typing import Awaitable, Callable, Optional
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+import utils.config as config
+import utils.helpers as helpers
+
+
+def make_fernet(keys: list[str]) -> MultiFernet:
+    """
+    Create a MultiFernet that encrypts with the first key and decrypts with any.
+    """
+    return MultiFernet([Fernet(key.strip().encode()) for key in keys])
+
+def rotate_tokens(keys: list[str], tokens: list[str]) -> list[Optional[str]]:
+    """
+    Re-encrypt tokens with the first key; None for tokens no key can decrypt.
+    Runs in a worker, so it takes the keys instead of a MultiFernet.
+    """
+    fernet = make_fernet(keys)
+    rotated = []
+    for token in tokens:
+        try:
+            rotated.append(fernet.rotate(token.encode()).decode())
+        except InvalidToken:
+            rotated.append(None)
+    return rotated
+
+async def rotate_user_keys(
+    users: list[dict], keys: list[str], mark_changed: Callable[[dict], None], persist: Callable[[], Awaitable[None]]
+) -> dict:
+    """
+    Re-encrypt every user's api_key with the first key, in batches on a worker pool so
+    the event loop keeps serving polls, persisting after every round of batches.
+    Returns the number of users rotated/failed and the throughput.
+    """
+    settings = config.key_rotation
+    if settings["executor"] == "process": # Spawned, not forked: forking a process with running threads can deadlock
+        executor = ProcessPoolExecutor(max_workers=settings["workers"], mp_context=multiprocessing.get_context("spawn"))
+    else:
+        executor = ThreadPoolExecutor(max_workers=settings["workers"])
+    users = list(users)
+    batches = [users[i:i + settings["batch_size"]] for i in range(0, len(users), settings["batch_size"])]
+    rotated = failed = 0
+    started = time.perf_counter()
+
+    loop = asyncio.get_running_loop()
+    try:
+        for i in range(0, len(batches), settings["workers"]): # One batch per worker at a time
+            round_batches = batches[i:i + settings["workers"]]
+            old_tokens = [[user["api_key"] for user in batch] for batch in round_batches]
+            new_tokens = await asyncio.gather(*(
+                loop.run_in_executor(executor, rotate_tokens, keys, tokens) for tokens in old_tokens
+            ))
+            for batch, old_batch, new_batch in zip(round_batches, old_tokens, new_tokens):
+                for user, old, new in zip(batch, old_batch, new_batch):
+                    if new is None:
+                        failed += 1
+                    elif user["api_key"] == old: # Skip tokens that were updated mid-rotation
+                        user["api_key"] = new
+                        mark_changed(user)
+                        rotated += 1
+            await persist()
+            helpers.log(f"Key rotation: {rotated + failed}/{len(users)} user(s) processed")
+    finally:
+        await asyncio.to_thread(executor.shutdown) # Waiting for the workers would block the loop
+
+    elapsed = time.perf_counter() - started
+    per_second = rotated / elapsed if elapsed else 0.0
+    helpers.log(f"Key rotation: rotated {rotated}, failed {failed} in {elapsed:.2f}s ({per_second:.0f} users/s)")
+    return {"rotated": rotated, "failed": failed, "seconds": elapsed, "per_second": per_second}
@@ -0,0 +1,280 @@
+"""
+Allocation regression benchmark for the polling hot path.
+
+Runs check_notifs_loop's cycle (minus the Discord sends) over synthetic users
+under tracemalloc and compares bytes per cycle, per user and per notification
+against the stored baseline, exiting with status 1 on a regression and 2 if
+the baseline can't be compared against (missing, or taken with other settings
+or another Python major.minor version). Usage:
+
+    python -m utils.membench                    # compare against the baseline
+    python -m utils.membench --update-baseline  # after an intended change
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from types import SimpleNamespace
+from typing import Optional
+
+from utils.AiohttpManager import AiohttpManager
+import utils.config as config
+import utils.datasets as datasets
+import utils.filtering as filtering
+import utils.polling as polling
+from utils.KeywordMatcher import KeywordMatcher
+from utils.LatencyTracker import LatencyTracker
+import utils.rendering as rendering
+from utils.TokenHealth import TokenHealth
+from utils.transports import Transport, TransportResponse
+
+
+baseline_path = os.path.join(os.path.dirname(__file__), "membench_baseline.json")
+python_version = "%d.%d" % sys.version_info[:2] # Allocation sizes differ between minor versions, not patch releases
+
+_TYPES = ["scoreComment", "scorePublication", "scoreStar", "scoreInvitation", "userFollow"]
+_TITLES = ["Piano sonata no. 2", "Draft for strings", "Nocturne (piano)", "Jazz standard lead sheet", "Choir warmups"]
+_ACTORS = 20
+_SCORES = 50
+
+
+class SyntheticFlatTransport(Transport):
+    """
+    The SyntheticFlatTransport class serves every token the same prebuilt page of
+    notifications for the current cycle, so only the bot's own allocations are measured.
+    """
+
+    def __init__(self, cycles: int, new_per_poll: int):
+        elements = [_element(i) for i in range(cycles * new_per_poll + config.notif_cache_length)]
+        self._pages = [ # newest first, like Flat
+            elements[max(newest - config.notif_cache_length, 0):newest][::-1]
+            for newest in range(config.notif_cache_length, len(elements) + 1, new_per_poll)
+        ]
+        self.cycle = 0
+
+    async def get(self, url: str, headers: Optional[dict[str, str]] = None) -> TransportResponse:
+        return TransportResponse(200, {}, self._pages[self.cycle])
+
+
+def _element(i: int) -> dict:
+    """
+    A Flat notification element (with the fields the bot reads).
+    """
+    actor, score = i % _ACTORS, i % _SCORES
+    element = {
+        "id": f"{i:024x}",
+        "type": _TYPES[i % len(_TYPES)],
+        "date": "2025-04-04T12:00:00.000Z",
+        "actor": {
+            "id": f"actor{actor:019x}",
+            "username": f"user{actor}",
+            "printableName": f"User_{actor} (*composer*)",
+            "htmlUrl": f"https://flat.io/user{actor}",
+        },
+        "attachments": {
+            "score": {"id": f"score{score:019x}", "title": _TITLES[score % len(_TITLES)], "htmlUrl": f"https://flat.io/score/{score}"},
+        },
+    }
+    if element["type"] == "scoreComment": # Expanded, see config.notif_api_url
+        text = f"Love the {_TITLES[i % len(_TITLES)].split()[0].lower()} voicings in bar {i % 64}"
+        element["attachments"]["scoreComment"] = {"id": f"comment{i:017x}", "comment": text, "rawComment": text}
+    return element
+
+def check_fixture() -> None:
+    """
+    Make sure the synthetic elements exercise the real code paths: comment text
+    reaches keyword rules and comment links render. Exits if they don't.
+    """
+    element = next(_element(i) for i in range(len(_TYPES)) if _TYPES[i] == "scoreComment")
+    comment = element["attachments"]["scoreComment"]
+    rules = {"keyword": ["+voicings"]} # Only in the comment text, not the score title
+    is_important, triggered_rules, _ = filtering.evaluate(element, rules, KeywordMatcher(rules["keyword"]), False)
+    if not is_important or triggered_rules != ["keyword: +voicings"]:
+        sys.exit(f"Keyword rules don't see comment text: {triggered_rules}")
+    if f"#c-{comment['id']}" not in rendering.render_notification(element, triggered_rules):
+        sys.exit("Comment link not rendered")
+
+def _user(n: int) -> dict:
+    """
+    A registered user like app.py keeps in user_data, with a stand-in for the discord.User.
+    """
+    user = {
+        "id": str(10**17 + n),
+        "api_key": f"token-{n}",
+        "important": {
+            "actor.username": {f"+actor{a:019x}": f"user{a}" for a in range(n % 3, _ACTORS, 4)},
+            "type": ["+scoreStar", "-scoreInvitation"],
+            "attachments.score.id": [f"-score{n % _SCORES:019x}"],
+            "keyword": ["+piano", "-draft", "+jazz*"],
+        },
+        "override": n % 10 == 0,
+        "paused": False,
+        "sendhere": {"bool": False},
+        "object": SimpleNamespace(id=10**17 + n),
+        "processed_ids": None,
+        "health": TokenHealth(),
+        "lock": asyncio.Lock(),
+        "version": datasets.new_version(),
+        "removed": False,
+    }
+    user["matcher"] = KeywordMatcher(user["important"]["keyword"])
+    return user
+
+async def _read_processed_ids(manager: AiohttpManager, user: dict) -> None:
+    """
+    Start the user from the current elements, like on startup, register and unpause.
+    """
+    elements = await manager.read_api(config.notif_api_url, user["api_key"])
+    user["processed_ids"] = polling.new_processed_ids(elements)
+
+def _set_rules(user: dict, important: dict) -> None:
+    """
+    As app.set_rules, without the dataset bookkeeping.
+    """
+    user["important"] = important
+    user["matcher"] = KeywordMatcher(important["keyword"])
+
+async def poll_cycle(users: list[dict], manager: AiohttpManager, latency_tracker: LatencyTracker) -> int:
+    """
+    One iteration of check_notifs_loop through the shared poll step, rendering instead of sending.
+    Returns the number of users polled.
+    """
+    polled = 0
+    for user in users:
+        deliveries = []
+        async with user["lock"]:
+            if user["removed"] or user["paused"] or not user["health"].due():
+                continue
+            deliveries = await polling.poll_user(user, user["api_key"], manager, latency_tracker, _set_rules)
+            if deliveries is None:
+                user["health"].record_failure()
+                continue
+            user["health"].record_success()
+            polled += 1
+
+        for element, triggered_rules, trace in deliveries:
+            rendering.render_notification(element, triggered_rules)
+            latency_tracker.mark(trace, "sent")
+            latency_tracker.mark(trace, "acked")
+            latency_tracker.record(trace)
+    return polled
+
+async def _churn(users: list[dict], manager: AiohttpManager, records: dict, cycle: int, next_user: int) -> None:
+    """
+    The command traffic between cycles: one user toggles pause, one unregisters and
+    a new one registers, then the changed users are serialized for persisting.
+    """
+    user = users[cycle % len(users)]
+    async with user["lock"]:
+        if user["paused"]:
+            await _read_processed_ids(manager, user)
+        user["paused"] = not user["paused"]
+        user["version"] = datasets.new_version()
+
+    removed = users.pop((cycle * 7) % len(users))
+    removed["removed"] = True
+    user = _user(next_user)
+    await _read_processed_ids(manager, user)
+    users.append(user)
+
+    datasets.serialize_users(users, records)
+
+async def measure(settings: dict) -> dict:
+    """
+    Run the warm-up and measured cycles, returning the allocation metrics.
+    """
+    cycles = settings["warmup_cycles"] + settings["cycles"]
+    transport = SyntheticFlatTransport(cycles, settings["new_per_poll"])
+    manager = AiohttpManager(transport)
+    latency_tracker = LatencyTracker()
+    records = {} # As app.persisted_records
+
+    tracemalloc.start() # Before creating users, so freeing the ones that unregister is traced too
+    users = [_user(n) for n in range(settings["users"])]
+    for user in users:
+        await _read_processed_ids(manager, user)
+    for cycle in range(settings["warmup_cycles"]):
+        transport.cycle = cycle + 1
+        await poll_cycle(users, manager, latency_tracker)
+        await _churn(users, manager, records, cycle, settings["users"] + cycle)
+    gc.collect()
+    start, _ = tracemalloc.get_traced_memory()
+
+    peak_total, notifications = 0, 0 # Running totals, so the measurement itself retains nothing
+    for cycle in range(settings["warmup_cycles"], cycles):
+        transport.cycle = cycle + 1
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        notifications += await poll_cycle(users, manager, latency_tracker) * settings["new_per_poll"] # Every poll sees new_per_poll new ones
+        await _churn(users, manager, records, cycle, settings["users"] + cycle)
+        peak_total += tracemalloc.get_traced_memory()[1] - before
+    gc.collect()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_cycle = peak_total / settings["cycles"]
+    return {
+        "bytes_per_cycle": per_cycle,
+        "bytes_per_user": per_cycle / settings["users"],
+        "bytes_per_notification": per_cycle * settings["cycles"] / max(notifications, 1),
+        "retained_bytes_per_cycle": (end - start) / settings["cycles"],
+    }
+
+def compare(results: dict, baseline: dict, settings: dict) -> list[str]:
+    """
+    Get the metrics that exceed the baseline by more than the tolerance (and slack).
+    """
+    regressions = []
+    for metric, value in results.items():
+        allowed = baseline[metric] + max(abs(baseline[metric]) * settings["tolerance"], settings["slack_bytes"])
+        if value > allowed:
+            regressions.append(f"{metric}: {value:.0f} bytes > {allowed:.0f} allowed (baseline {baseline[metric]:.0f})")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Allocation regression benchmark for the polling hot path.")
+    parser.add_argument("--update-baseline", action="store_true", help=f"store the results as the baseline ({baseline_path})")
+    args = parser.parse_args()
+    check_fixture()
+
+    settings = config.membench
+    run_settings = {key: settings[key] for key in ("users", "new_per_poll", "warmup_cycles", "cycles")}
+    # poll_user logs every notification; line buffered so the write buffer doesn't show up as retained bytes
+    with open(os.devnull, "w", buffering=1) as devnull, contextlib.redirect_stdout(devnull):
+        results = asyncio.run(measure(settings))
+    for metric, value in results.items():
+        print(f"{metric}: {value:.0f}")
+
+    if args.update_baseline:
+        with open(baseline_path, "w") as file:
+            json.dump({"settings": run_settings, "python": python_version, "metrics": results}, file, indent=4)
+        print(f"Baseline updated: {baseline_path}")
+        return
+
+    unusable = None
+    try:
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        unusable = f"No baseline at {baseline_path}, run with --update-baseline first"
+    else:
+        if baseline["settings"] != run_settings:
+            unusable = f"config.membench changed since the baseline ({baseline['settings']}), run with --update-baseline"
+        elif baseline["python"] != python_version:
+            unusable = f"The baseline was taken on Python {baseline['python']}, run with --update-baseline on {python_version}"
+    if unusable: # Not a regression, so not status 1
+        print(unusable, file=sys.stderr)
+        sys.exit(2)
+
+    regressions = compare(results, baseline["metrics"], settings)
+    if regressions:
+        print("Allocation regression:\n" + "\n".join(regressions))
+        sys.exit(1)
+    print(f"Within {settings['tolerance']:.0%} of the baseline")
+
+if __name__ == "__main__":
+    main()
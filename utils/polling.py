@@ -0,0 +1,71 @@
+from collections import deque
+import time
+from typing import Callable, Optional
+
+from utils.AiohttpManager import AiohttpManager, APIRequestError
+from utils.LatencyTracker import LatencyTracker
+import utils.config as config
+import utils.filtering as filtering
+import utils.helpers as helpers
+
+
+def new_processed_ids(elements: list[dict]) -> deque:
+    """
+    Start a user's processed ids from the current elements (newest first, like Flat),
+    stored oldest first so the bounded deque evicts the oldest ids.
+    """
+    return deque(reversed([element['id'] for element in elements]), maxlen=config.notif_cache_length)
+
+async def poll_user(
+    user: dict, api_key: str, manager: AiohttpManager, latency_tracker: LatencyTracker,
+    set_rules: Callable[[dict, dict], None]
+) -> Optional[list[tuple[dict, list[str], dict]]]:
+    """
+    Read a user's notifications and evaluate the new ones against a snapshot of their rules
+    (check_notifs_loop's per-user step; the caller holds the user's lock and handles backoff).
+    Returns the (element, triggered_rules, trace) to send, or None if the notifications couldn't be read.
+    """
+    try:
+        elements = await manager.read_api(config.notif_api_url, api_key)
+        fetched_at = time.time()
+    except APIRequestError as e: # handle edge case http codes
+        helpers.log("Edge case http code handler:", e)
+        return None
+    if not elements: # Invalid token or server error
+        return None
+
+    if not user["processed_ids"]: # Couldn't be set on startup, start from the current elements
+        user["processed_ids"] = new_processed_ids(elements)
+        return []
+
+    # Evaluate against a snapshot of the rules; commands swap in new rules instead of changing them
+    important, matcher, override = user["important"], user["matcher"], user["override"]
+    deliveries, renames, new_ids = [], [], []
+    for element in elements:
+        # Break if element already processed (everything after is also already processed)
+        if element['id'] in user["processed_ids"]:
+            break
+        trace = latency_tracker.trace(element, fetched_at)
+
+        is_important, triggered_rules, element_renames = filtering.evaluate(element, important, matcher, override)
+        renames += element_renames
+        helpers.log(
+            f"{element['actor']['printableName']}: {element['type']}, ID-{element['id']} "
+            f"{'is' if is_important else 'is not'} categorized as important"
+            f"{' by rule(s): ' + str(triggered_rules) if is_important else '.'}"
+        ) # DEBUG
+        latency_tracker.mark(trace, "decided")
+
+        if is_important or override:
+            deliveries.append((element, triggered_rules, trace))
+        else:
+            latency_tracker.record(trace)
+
+        new_ids.append(element['id'])
+
+    # Add ids oldest first, so the bounded deque evicts the oldest ids rather than the ones just added
+    user["processed_ids"].extend(reversed(new_ids))
+
+    if renames: # Keep usernames up to date
+        set_rules(user, filtering.apply_renames(user["important"], renames))
+    return deliveries
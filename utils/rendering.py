@@ -0,0 +1,46 @@
+from functools import lru_cache
+from typing import Callable
+
+import utils.config as config
+import utils.helpers as helpers
+
+
+def _score_url(element: dict) -> str:
+    return element['attachments']['score']['htmlUrl'] + "\n"
+
+def _score_comment_url(element: dict) -> str:
+    comment = element['attachments']['scoreComment'] # Expanded by notif_api_url; just the id in older recordings
+    comment_id = comment['id'] if isinstance(comment, dict) else comment
+    return element['attachments']['score']['htmlUrl'] + "#c-" + comment_id + "\n"
+
+def _actor_url(element: dict) -> str:
+    return element['actor']['htmlUrl'] + "\n"
+
+# Notification type: url builder
+url_builders: dict[str, Callable[[dict], str]] = {
+    "scoreComment": _score_comment_url,
+    "scorePublication": _score_url,
+    "scoreStar": _score_url,
+    "scoreInvitation": _score_url,
+    "userFollow": _actor_url,
+}
+
+
+@lru_cache(maxsize=config.render_cache_size)
+def esc_md_cached(text: str) -> str:
+    """
+    Escape markdown of frequently repeated text (e.g. actor display names and types).
+    """
+    return helpers.esc_md(text)
+
+def render_notification(element: dict, triggered_rules: list[str]) -> str:
+    """
+    Compose the message for a notification element.
+    Raises KeyError if some expected value is undefined.
+    """
+    builder = url_builders.get(element['type'])
+    url = builder(element) if builder else ""
+    return (
+        f"{esc_md_cached(element['actor']['printableName'])}: {esc_md_cached(element['type'])} [(Open on Flat)]({url})\n"
+        f"-# Rule(s): {helpers.esc_md(str(triggered_rules))}"
+    )
@@ -0,0 +1,12 @@
+import utils.config as config
+
+
+def loop_interval(users: list[dict]) -> int:
+    """
+    Number of users to poll times x, unless there are none then default to y.
+    """
+    num_users = sum(1 for user in users if not user["paused"] and user["health"].due())
+    return (
+        num_users * config.delay_amounts["per_user"] 
+        if num_users > 0 else config.delay_amounts["per_loop_default"]
+    )
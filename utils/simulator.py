@@ -0,0 +1,266 @@
+"""
+Capacity-planning simulator for the polling configuration.
+
+Runs the real loop interval (utils.scheduling), per-user poll step (utils.polling),
+backoff (TokenHealth) and request path (AiohttpManager) against a simulated Flat API
+on a virtual clock, so hours of polling take seconds. Usage:
+
+    python -m utils.simulator --users 500 --rate 2 --hours 6 --slo 300
+"""
+import argparse
+import asyncio
+import bisect
+from collections import deque
+import contextlib
+import math
+import os
+import random
+from typing import Optional
+
+from utils.AiohttpManager import AiohttpManager
+import utils.config as config
+from utils.KeywordMatcher import KeywordMatcher
+from utils.LatencyTracker import LatencyTracker
+import utils.polling as polling
+import utils.scheduling as scheduling
+from utils.TokenHealth import TokenHealth
+from utils.transports import Transport, TransportResponse, credential_of
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    An event loop whose clock jumps straight to the next scheduled callback
+    whenever nothing is ready, so sleeps take no real time.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._virtual_time = 0.0
+
+    def time(self) -> float:
+        return self._virtual_time
+
+    def _run_once(self) -> None:
+        if not self._ready and self._scheduled:
+            self._virtual_time = max(self._virtual_time, self._scheduled[0]._when)
+        super()._run_once()
+
+
+class SimulatedFlatTransport(Transport):
+    """
+    The SimulatedFlatTransport class serves per-token notification lists
+    from precomputed arrival times, with response latency, random server
+    errors and Flat's per-token rate limit.
+    """
+
+    def __init__(self, arrivals: dict[str, list[float]], latency: float, error_rate: float, rng: random.Random):
+        self._arrivals = arrivals # token: sorted arrival times
+        self._latency = latency
+        self._error_rate = error_rate
+        self._rng = rng
+        self.calls = {token: deque() for token in arrivals} # token: call times within the last hour
+        self.max_calls_per_hour = 0
+        self.rate_limited = 0
+
+    async def get(self, url: str, headers: Optional[dict[str, str]] = None) -> TransportResponse:
+        loop = asyncio.get_running_loop()
+        token = credential_of(headers)
+        await asyncio.sleep(self._rng.expovariate(1 / self._latency) if self._latency else 0)
+        now = loop.time()
+
+        calls = self.calls[token]
+        calls.append(now)
+        while calls[0] <= now - 3600:
+            calls.popleft()
+        self.max_calls_per_hour = max(self.max_calls_per_hour, len(calls))
+        if len(calls) > config.flat_rate_limits["per_user_per_hour"]:
+            self.rate_limited += 1
+            return TransportResponse(429, {}, None)
+        if self._rng.random() < self._error_rate:
+            return TransportResponse(500, {}, None)
+
+        arrived = self._arrivals[token]
+        newest = bisect.bisect_right(arrived, now) - 1
+        body = [
+            { # newest first, like Flat
+                "id": f"{token}-{i}", "created": arrived[i], "type": "scorePublication",
+                "actor": {"id": "actor", "username": "actor", "printableName": "Actor"},
+            }
+            for i in range(newest, max(newest - config.notif_cache_length, -1), -1)
+        ]
+        return TransportResponse(200, {}, body)
+
+
+def generate_arrivals(users: int, rate: float, heavy_fraction: float, heavy_rate: float, hours: float, rng: random.Random) -> dict[str, list[float]]:
+    """
+    Poisson notification arrival times per token; heavy_fraction of users get heavy_rate (per hour) instead of rate.
+    Every token starts with a full page of older notifications, like an established Flat account.
+    """
+    arrivals = {}
+    for n in range(users):
+        user_rate = (heavy_rate if rng.random() < heavy_fraction else rate) / 3600
+        times, t = [-3600.0 * (config.notif_cache_length - i) for i in range(config.notif_cache_length)], 0.0
+        while user_rate > 0:
+            t += rng.expovariate(user_rate)
+            if t > hours * 3600:
+                break
+            times.append(t)
+        arrivals[f"token-{n}"] = times
+    return arrivals
+
+def percentile(ordered: list[float], p: float) -> float:
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] if ordered else math.nan
+
+def _set_rules(user: dict, important: dict) -> None:
+    user["important"] = important
+    user["matcher"] = KeywordMatcher(important.get("keyword", []))
+
+async def simulate(arrivals: dict[str, list[float]], hours: float, latency: float, error_rate: float, seed: int) -> dict:
+    """
+    Run check_notifs_loop's scheduling for the given number of (virtual) hours.
+    Users have override on, so every new notification is delivered.
+    """
+    loop = asyncio.get_running_loop()
+    transport = SimulatedFlatTransport(arrivals, latency, error_rate, random.Random(seed))
+    manager = AiohttpManager(transport)
+    latency_tracker = LatencyTracker()
+    users = [
+        {
+            "api_key": token, "paused": False, "health": TokenHealth(clock=loop.time), "processed_ids": None,
+            "important": {}, "matcher": KeywordMatcher([]), "override": True, "polls": [], "delivered": 0,
+        }
+        for token in arrivals
+    ]
+    delivered, failures = [], 0
+
+    end = hours * 3600
+    while loop.time() < end:
+        start = loop.time()
+        interval = scheduling.loop_interval(users) # Same as check_notifs_loop.change_interval
+        for user in users:
+            if user["paused"] or not user["health"].due():
+                continue
+            deliveries = await polling.poll_user(user, user["api_key"], manager, latency_tracker, _set_rules)
+            if deliveries is None: # Server error or rate limited, back off like check_notifs_loop
+                failures += 1
+                user["health"].record_failure()
+                continue
+            user["health"].record_success()
+            now = loop.time()
+            user["polls"].append(now)
+            delivered += [now - element["created"] for element, _, _ in deliveries]
+            user["delivered"] += len(deliveries)
+            await asyncio.sleep(config.delay_amounts["per_user"]) # wait between checks
+
+        await asyncio.sleep(max(start + interval - loop.time(), 0)) # tasks.loop runs late iterations immediately
+
+    # Arrivals between a user's first and last poll that were never delivered fell out of the notif_cache_length window
+    missed = sum(
+        bisect.bisect_right(arrivals[user["api_key"]], user["polls"][-1])
+        - bisect.bisect_right(arrivals[user["api_key"]], user["polls"][0])
+        - user["delivered"]
+        for user in users if user["polls"]
+    )
+    periods = [b - a for user in users for a, b in zip(user["polls"], user["polls"][1:])]
+    delivered.sort()
+    limit = config.flat_rate_limits["per_user_per_hour"]
+    return {
+        "poll_period_mean": sum(periods) / len(periods) if periods else math.nan,
+        "poll_period_max": max(periods, default=math.nan),
+        "latency_p50": percentile(delivered, 50),
+        "latency_p90": percentile(delivered, 90),
+        "latency_p99": percentile(delivered, 99),
+        "delivered": len(delivered),
+        "missed": missed,
+        "failures": failures,
+        "api_requests": manager.stats["requests"],
+        "max_calls_per_token_hour": transport.max_calls_per_hour,
+        "rate_limit_headroom": 1 - transport.max_calls_per_hour / limit,
+        "rate_limited": transport.rate_limited,
+    }
+
+def run(arrivals: dict[str, list[float]], hours: float, latency: float, error_rate: float, seed: int, delays: Optional[dict] = None) -> dict:
+    """
+    Run simulate() on a virtual clock, with delay_amounts overridden by delays.
+    """
+    loop = VirtualClockLoop()
+    current = dict(config.delay_amounts)
+    config.delay_amounts.update(delays or {})
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): # poll_user logs every notification
+            return loop.run_until_complete(simulate(arrivals, hours, latency, error_rate, seed))
+    finally:
+        config.delay_amounts.update(current)
+        loop.close()
+
+def meets_slo(results: dict, slo: float) -> bool:
+    """
+    Whether a simulation met the p90 latency SLO without missing or being rate limited.
+    """
+    return results["latency_p90"] <= slo and results["missed"] == 0 and results["rate_limited"] == 0
+
+def recommend(
+    arrivals: dict[str, list[float]], hours: float, latency: float, error_rate: float, seed: int, slo: float, steps: int = 8
+) -> tuple[Optional[dict], dict]:
+    """
+    Search for the largest per_user delay (the fewest API requests) that meets the SLO,
+    simulating every candidate. Returns the recommended delays and their results,
+    or None and the results without any delay if a sequential poller can't meet the SLO.
+    """
+    def delays(per_user: float) -> dict:
+        return {"per_user": round(per_user, 2), "per_user_startup": max(round(per_user, 2), 0.1)}
+
+    fastest = run(arrivals, hours, latency, error_rate, seed, delays(0))
+    if not meets_slo(fastest, slo):
+        return None, fastest
+
+    low, low_results = 0.0, fastest # Meets the SLO
+    high = slo / max(len(arrivals), 1) # A loop of users * per_user takes as long as the SLO, so ~p90 > SLO
+    while (results := run(arrivals, hours, latency, error_rate, seed, delays(high))) and meets_slo(results, slo):
+        low, low_results, high = high, results, high * 2
+    for _ in range(steps): # Bisect between the largest delay meeting the SLO and the smallest missing it
+        middle = (low + high) / 2
+        results = run(arrivals, hours, latency, error_rate, seed, delays(middle))
+        if meets_slo(results, slo):
+            low, low_results = middle, results
+        else:
+            high = middle
+    return dict(config.delay_amounts, **delays(low)), low_results
+
+def report(title: str, results: dict) -> str:
+    lines = [title]
+    for key, value in results.items():
+        lines.append(f"  {key}: {value:.3f}" if isinstance(value, float) else f"  {key}: {value}")
+    return "\n".join(lines)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulate polling capacity on a virtual clock.")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=2, help="notifications per user per hour")
+    parser.add_argument("--heavy-fraction", type=float, default=0.05, help="fraction of users with --heavy-rate")
+    parser.add_argument("--heavy-rate", type=float, default=30, help="notifications per heavy user per hour")
+    parser.add_argument("--hours", type=float, default=6, help="simulated hours")
+    parser.add_argument("--api-latency", type=float, default=0.3, help="mean Flat API response time, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with a server error")
+    parser.add_argument("--slo", type=float, default=300, help="target p90 delivery latency, seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    arrivals = generate_arrivals(args.users, args.rate, args.heavy_fraction, args.heavy_rate, args.hours, random.Random(args.seed))
+    simulation = (arrivals, args.hours, args.api_latency, args.error_rate, args.seed)
+    print(report(f"Current delay_amounts {config.delay_amounts}:", run(*simulation)))
+
+    recommended, results = recommend(*simulation, args.slo)
+    if recommended:
+        print(report(f"Recommended delay_amounts {recommended} (p90 SLO {args.slo:g}s):", results))
+        return
+    loop_seconds = args.users * args.api_latency
+    print(report(
+        f"A p90 SLO of {args.slo:g}s can't be met by a sequential poller: even with no delay between users, "
+        f"a loop takes ~{args.users} users x {args.api_latency:g}s API latency = {loop_seconds:.0f}s. "
+        "Results with no delay:",
+        results,
+    ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+from abc import ABC, abstractmethod
+import asyncio
+import json
+import time
+from typing import Any, NamedTuple, Optional
+
+import aiohttp
+
+import utils.helpers as helpers
+
+
+class TransportResponse(NamedTuple):
+    status: int
+    headers: dict[str, str]
+    body: Any # parsed JSON, or None if the request failed
+
+
+class Transport(ABC):
+    """
+    The Transport class is the interface AiohttpManager sends GET requests through.
+    """
+
+    @property
+    def opened(self) -> bool:
+        return True
+
+    async def open(self) -> None:
+        """
+        Open (or reopen) the transport.
+        """
+
+    async def close(self) -> None:
+        """
+        Close the transport.
+        """
+
+    @abstractmethod
+    async def get(self, url: str, headers: Optional[dict[str, str]] = None) -> TransportResponse:
+        """
+        Send a GET request. Raises aiohttp.ClientError if no response could be had.
+        """
+
+
+class AiohttpTransport(Transport):
+    """
+    The AiohttpTransport class sends requests over the network with an aiohttp session.
+    """
+
+    def __init__(self):
+        self._session = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    async def open(self) -> None:
+        await self.close()
+        self._session = aiohttp.ClientSession()
+        helpers.log("Aiohttp session created.")
+
+    async def close(self) -> None:
+        if self._session:
+            await self._session.close()
+            helpers.log("Aiohttp session closed.")
+
+    async def get(self, url: str, headers: Optional[dict[str, str]] = None) -> TransportResponse:
+        async with self._session.get(url, headers=headers) as response:
+            body = await response.json() if response.status < 400 else None
+            return TransportResponse(response.status, dict(response.headers), body)
+
+
+class RecordingTransport(Transport):
+    """
+    The RecordingTransport class records the responses (and timing) of another
+    transport into a cassette file, scrubbing tokens. The cassette is JSON lines,
+    one interaction per line, flushed (off the event loop) as each response
+    arrives so a killed process keeps everything recorded so far.
+    """
+
+    # Response headers worth keeping (e.g. for rate limit analysis)
+    kept_headers = {"Content-Type", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset"}
+
+    def __init__(self, path: str, inner: Optional[Transport] = None):
+        self._path = path
+        self._inner = inner or AiohttpTransport()
+        self._aliases = {} # token: alias
+        self._file = None # opened on the first response, so a new recording replaces the old cassette
+        self._file_lock = asyncio.Lock() # keeps lines in order and the file open while writing
+        self.recorded = 0
+
+    @property
+    def opened(self) -> bool:
+        return self._inner.opened
+
+    async def open(self) -> None:
+        await self._inner.open()
+
+    async def close(self) -> None:
+        await self._inner.close()
+        async with self._file_lock:
+            if self._file:
+                await asyncio.to_thread(self._file.close)
+                self._file = None
+                helpers.log(f"Recorded {self.recorded} interaction(s) to {self._path}")
+
+    async def _write(self, interaction: dict) -> None:
+        """
+        Append an interaction to the cassette.
+        """
+        line = json.dumps(interaction) + "\n"
+        async with self._file_lock:
+            await asyncio.to_thread(self._write_line, line)
+            self.recorded += 1
+
+    def _write_line(self, line: str) -> None:
+        """
+        Write and flush a line of the cassette (in a worker thread).
+        """
+        if not self._file:
+            self._file = open(self._path, "w" if not self.recorded else "a")
+        self._file.write(line)
+        self._file.flush()
+
+    def _scrub(self, value: Any, token: Optional[str], alias: Optional[str]) -> Any:
+        """
+        Replace the token wherever it appears in a JSON-serializable value.
+        """
+        if not token:
+            return value
+        text = json.dumps(value)
+        return json.loads(text.replace(token, alias)) if token in text else value
+
+    async def get(self, url: str, headers: Optional[dict[str, str]] = None) -> TransportResponse:
+        token = credential_of(headers)
+        alias = self._aliases.setdefault(token, f"token-{len(self._aliases) + 1}") if token else None
+        started = time.perf_counter()
+        response = await self._inner.get(url, headers)
+        await self._write({
+            "url": self._scrub(url, token, alias),
+            "credential": alias,
+            "status": response.status,
+            "headers": {key: value for key, value in response.headers.items() if key in self.kept_headers},
+            "body": self._scrub(response.body, token, alias),
+            "elapsed": time.perf_counter() - started,
+        })
+        return response
+
+
+class ReplayTransport(Transport):
+    """
+    The ReplayTransport class serves the responses of a cassette back, in recorded order
+    per (url, credential), at the recorded speed times speed (0 for no delay).
+    Tokens are matched to the recorded credentials in order of first use, and the
+    last response for a (url, credential) is repeated once the recording runs out.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        with open(path) as file:
+            lines = file.read().splitlines()
+        interactions = []
+        for number, line in enumerate(lines, 1):
+            try:
+                interactions.append(json.loads(line))
+            except json.JSONDecodeError:
+                if number < len(lines): # Only the last line can be cut off (by the recording process being killed)
+                    raise
+                helpers.log(f"Skipped the incomplete last line of {path}")
+        self._speed = speed
+        self._aliases = {} # token: alias
+        self._recorded = {} # (url, credential): interactions
+        for interaction in interactions:
+            self._recorded.setdefault((interaction["url"], interaction["credential"]), []).append(interaction)
+        self._served = {} # (url, credential): interactions served
+
+    async def get(self, url: str, headers: Optional[dict[str, str]] = None) -> TransportResponse:
+        token = credential_of(headers)
+        alias = self._aliases.setdefault(token, f"token-{len(self._aliases) + 1}") if token else None
+        key = (url.replace(token, alias) if token else url, alias)
+        interactions = self._recorded.get(key)
+        if not interactions:
+            raise aiohttp.ClientConnectionError(f"No recorded response for {key[0]} ({alias})")
+
+        served = self._served.get(key, 0)
+        self._served[key] = served + 1
+        interaction = interactions[min(served, len(interactions) - 1)]
+        if self._speed:
+            await asyncio.sleep(interaction["elapsed"] / self._speed)
+        return TransportResponse(interaction["status"], interaction["headers"], interaction["body"])
+
+
+def credential_of(headers: Optional[dict[str, str]]) -> Optional[str]:
+    """
+    Get the bearer token from request headers, if any.
+    """
+    authorization = (headers or {}).get("Authorization", "")
+    return authorization.removeprefix("Bearer ") or None
+
+
+def from_spec(spec: Optional[str]) -> Transport:
+    """
+    Create a transport from a spec: empty for the network, record:path to record
+    a cassette, or replay:path[:speed] to replay one.
+    """
+    if not spec:
+        return AiohttpTransport()
+    mode, _, rest = spec.partition(":")
+    if mode == "record":
+        return RecordingTransport(rest)
+    if mode == "replay":
+        path, _, speed = rest.partition(":")
+        return ReplayTransport(path, float(speed) if speed else 1.0)
+    raise ValueError(f"Unknown transport spec: {spec}")